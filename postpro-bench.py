@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import importlib.util
+from datetime import datetime
+import numba
+import numpy as np
+import netCDF4
+from util.Synthetic import Synthetic
+
+
+# Stages of the postprocessing, as recorded by the --metrics of the scripts, in
+# report order; process is the whole script, imports and kernel loading included
+stages = ["read", "geometry", "diagnostics", "horizontal", "vertical", "reductions", "write", "total", "process"]
+
+# The WRF product runs only when wrf-python is installed
+wrfPython = importlib.util.find_spec("wrf") is not None
+
+
+# Product -> source file generator
+generators = {
+    "rms3": Synthetic.roms,
+    "wcm3": Synthetic.wacomm,
+    "wrf5": Synthetic.wrf,
+    "ww33": Synthetic.ww33,
+}
+
+
+def sources(product, synthetic, workdir):
+    """
+    Write the synthetic source files of the product. WRF has two consecutive
+    hours, run in one batch, so that the second takes the past fields of the
+    first from the state rather than recomputing them.
+    """
+    if product == "wrf5":
+        paths = [os.path.join(workdir, "wrf5-src", "wrfout_d01_2024-01-01_%02d.nc" % hour) for hour in (0, 1)]
+        os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+        for hour, path in enumerate(paths):
+            synthetic.wrf(path, datetime(2024, 1, 1, hour))
+        return paths
+    path = os.path.join(workdir, product + "-src.nc")
+    generators[product](synthetic, path)
+    return [path]
+
+
+def command(product, sources, dst, workdir, args):
+    """
+    The command line of the postprocessing script of the product, as the runs
+    call it.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "postpro-" + product + ".py")
+    if product == "wrf5":
+        arguments = sources + [sources[0], sources[0], dst]
+    else:
+        arguments = sources + [workdir, dst]
+    options = ["--method", args.method] + (["--float32"] if args.float32 else [])
+    if args.geometry_cache:
+        options += ["--cache-dir", os.path.join(workdir, "cache")]
+    if args.tile and product in ("rms3", "wcm3"):
+        options += ["--tile", str(args.tile)]
+    if args.workers > 1 and product == "rms3":
+        options += ["--workers", str(args.workers)]
+    return [sys.executable, script, "20240101"] + arguments + options
+
+
+def run(product, sources, workdir, args):
+    """
+    Run the script of the product once, and return its stages summed over the
+    source files, from its metrics, with the whole process.
+    """
+    dst = os.path.join(workdir, product + "-dst")
+    shutil.rmtree(dst, ignore_errors=True)
+    if len(sources) == 1:
+        dst += ".nc"
+    path = os.path.join(workdir, product + "-metrics.jsonl")
+    if os.path.exists(path):
+        os.remove(path)
+    log = os.path.join(workdir, product + ".log")
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall = time.perf_counter()
+    with open(log, "w") as f:
+        status = subprocess.call(command(product, sources, dst, workdir, args) + ["--metrics", path],
+                                 stdout=f, stderr=subprocess.STDOUT)
+    wall = time.perf_counter() - wall
+    if status != 0:
+        raise RuntimeError("postpro-" + product + ".py failed with status " + str(status) + ", see " + log)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    results = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            result = results.setdefault(record["stage"], {"wall": 0.0, "cpu": 0.0, "peak_rss": 0, "read_bytes": 0,
+                                                          "write_bytes": 0})
+            for key in ("wall", "cpu", "read_bytes", "write_bytes"):
+                result[key] += record[key]
+            result["peak_rss"] = max(result["peak_rss"], record["peak_rss"])
+    # The whole script: its wall and CPU time, and the peak RSS and the bytes
+    # of the files, as the metrics do not cover the imports
+    results["process"] = {"wall": wall,
+                          "cpu": usage.ru_utime + usage.ru_stime - children.ru_utime - children.ru_stime,
+                          "peak_rss": results["total"]["peak_rss"],
+                          "read_bytes": results["total"]["read_bytes"],
+                          "write_bytes": results["total"]["write_bytes"]}
+    return results
+
+
+def compare(report, baseline, tolerance, floor):
+    """
+    Compare the stages with the baseline report.
+
+    Returns:
+        list: the regressions, stages whose wall time or peak RSS grew beyond
+              the tolerance (and above the noise floors).
+    """
+    if report["config"] != baseline.get("config"):
+        print("WARNING *** The baseline has a different configuration: " + json.dumps(baseline.get("config")))
+
+    regressions = []
+    for product, results in report["products"].items():
+        for name, result in results.items():
+            base = baseline.get("products", {}).get(product, {}).get(name)
+            if base is None:
+                continue
+            for metric, minimum in (("wall", floor), ("peak_rss", 1024 ** 2)):
+                if metric not in base:
+                    # A baseline of an earlier version of the report
+                    continue
+                if result[metric] > base[metric] * (1 + tolerance) and result[metric] - base[metric] > minimum:
+                    regressions.append(product + " " + name + " " + metric + ": " + str(round(base[metric], 4)) +
+                                       " -> " + str(round(result[metric], 4)))
+    return regressions
+
+
+def printReport(report):
+    print("%-6s %-12s %10s %10s %10s %10s %10s" % ("", "stage", "wall s", "cpu s", "rss MB", "read MB",
+                                                    "written MB"))
+    for product, results in report["products"].items():
+        for name in stages:
+            if name in results:
+                result = results[name]
+                print("%-6s %-12s %10.4f %10.4f %10.1f %10.1f %10.1f" % (product, name, result["wall"], result["cpu"],
+                                                                         result["peak_rss"] / 1024 ** 2,
+                                                                         result["read_bytes"] / 1024 ** 2,
+                                                                         result["write_bytes"] / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the postprocessing scripts on synthetic ROMS, Wacomm, WRF and WW3 files: wall and "
+                    "CPU time, peak RSS and I/O of each stage, from the --metrics of the scripts, as JSON, "
+                    "optionally compared with a baseline.")
+    parser.add_argument("--products", nargs="+", choices=list(generators), default=list(generators),
+                        help="products to benchmark (default: all)")
+    parser.add_argument("--ny", type=int, default=200, help="source grid rows (default: 200)")
+    parser.add_argument("--nx", type=int, default=250, help="source grid columns (default: 250)")
+    parser.add_argument("--levels", type=int, default=30, help="source vertical levels (default: 30)")
+    parser.add_argument("--records", type=int, default=1, help="time records of the ocean files (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each product; the fastest time of each stage is kept (default: 3)")
+    parser.add_argument("--method", choices=["nearest", "bilinear", "idw"], default="nearest",
+                        help="horizontal interpolation method (default: nearest)")
+    parser.add_argument("--float32", action="store_true", help="interpolate in single precision")
+    parser.add_argument("--geometry-cache", action="store_true",
+                        help="run the scripts with a geometry cache in the work directory, filled by the first run, "
+                             "so that the fastest geometry stage is that of a warm cache")
+    parser.add_argument("--tile", type=int, metavar="N", help="tile size of rms3 and wcm3 (default: no tiles)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of rms3 (default: 1)")
+    parser.add_argument("--workdir", help="directory of the synthetic files, kept (default: a temporary one)")
+    parser.add_argument("--output", help="JSON report file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON report to compare with; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative growth of a stage reported as a regression (default: 0.2)")
+    parser.add_argument("--floor", type=float, default=0.01,
+                        help="smallest wall time growth in seconds reported as a regression (default: 0.01)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="postpro-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    synthetic = Synthetic(args.ny, args.nx, args.levels, args.records)
+
+    report = {
+        "config": {"ny": args.ny, "nx": args.nx, "levels": args.levels, "records": args.records,
+                   "method": args.method, "float32": args.float32, "geometry-cache": args.geometry_cache,
+                   "tile": args.tile, "workers": args.workers},
+        "environment": {"date": datetime.now().isoformat(timespec="seconds"), "machine": platform.machine(),
+                        "python": platform.python_version(), "numpy": np.__version__, "numba": numba.__version__,
+                        "netCDF4": netCDF4.__version__, "cpus": os.cpu_count(), "threads": numba.get_num_threads(),
+                        "wrf-python": wrfPython},
+        "products": {},
+    }
+
+    keep = bool(args.workdir)
+    try:
+        for product in args.products:
+            if product == "wrf5" and not wrfPython:
+                print("WARNING *** wrf-python is not installed: skipping wrf5")
+                continue
+            print("Generating the " + product + " sources...")
+            paths = sources(product, synthetic, workdir)
+
+            best = {}
+            for repeat in range(args.repeat):
+                print(product + " run " + str(repeat + 1) + "...")
+                for name, result in run(product, paths, workdir, args).items():
+                    if name not in best:
+                        best[name] = result
+                    else:
+                        best[name] = {key: (min if key in ("wall", "cpu") else max)(best[name][key], value)
+                                      for key, value in result.items()}
+            report["products"][product] = best
+    except RuntimeError as e:
+        # Keep the work directory, with the log of the failed script
+        keep = True
+        print(e)
+        sys.exit(1)
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    printReport(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.floor)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against " + args.compare)
@@ -1,27 +1,134 @@
-import sys
+import argparse
+import numba
 import numpy as np
+import multiprocessing
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 from netCDF4 import Dataset
+from util.Profiler import Profiler
+from util.Batch import Batch
+from util.Encoding import Encoding
+from util.GeometryCache import GeometryCache
+from util.Metrics import Metrics
 from util.Interpolator import Interp2D, Interp3D, depths
+from util.Region import Region
 from util.ROMS import ROMS
+from util.Tiles import Tiles
 
 
-if __name__ == '__main__':
-    if len(sys.argv) != 5:
-        print("Usage: python " + str(sys.argv[0]) + " initialization_date source_file history_dir destination_file")
-        sys.exit(-1)
+# Interpolators by grid, built before the worker pool is forked so that the
+# workers share their geometry with the main process, and reused across the
+# files of a batch with the same grid
+interpolators = {}
 
-    iDate = sys.argv[1]
-    src = sys.argv[2]
-    history_dir = sys.argv[3]
-    dst = sys.argv[4]
+# Source variables in processing order, and the interpolator of each
+variables = ["zeta", "temp", "salt", "u", "ubar", "v", "vbar"]
+grids = {"zeta": "2DRho", "temp": "3DRho", "salt": "3DRho", "u": "3DU", "ubar": "2DU", "v": "3DV", "vbar": "2DV"}
+
+# In tiled mode, the interpolators of the last tile, reused for its record batches
+tileInterpolators = {}
+
+# Stage metrics, set before the worker pool is forked
+metrics = Metrics()
+
+
+def processVariable(src, name, start, end, interpolators=interpolators):
+    """
+    Interpolate the records start:end of a source variable, on the whole
+    destination grid or, with the interpolators of a tile, on the tile.
+
+    Returns:
+        dict: output variable name -> interpolated values, including the bottom
+              and surface fields of the 3D variables.
+    """
+    print(name + "...")
+    grid = grids[name]
+    with metrics.stage("read"):
+        ncsrcfile = Dataset(src)
+        # Only the window of the source grid covering the region or the tile
+        invar = ncsrcfile[name][(slice(start, end), Ellipsis) + interpolators["windows"][grid]]
+        ncsrcfile.close()
+
+    if grid.startswith("2D"):
+        with metrics.stage("horizontal"):
+            results = {name: interpolators[grid].interpLevels(invar)}
+    else:
+        factor = 1.2 if name in ("u", "v") else 1.0
+        with metrics.stage("horizontal"):
+            outvar3d = interpolators[grid].interpLevels(invar)
+        with metrics.stage("vertical"):
+            outvar, surface, bottom = interpolators[grid].verticalFields(outvar3d, factor=factor)
+        del outvar3d
+        results = {
+            name + "Bottom": bottom,
+            name + "Surface": surface,
+            name: outvar,
+        }
+
+    print("..." + name)
+    return results
+
+
+def processTile(src, tile, start, end):
+    """
+    Interpolate the records start:end of all the source variables on a tile
+    of the destination grid.
+
+    Returns:
+        dict: output variable name -> interpolated values on the tile, with h.
+    """
+    print("Tile " + str(tile[0].start) + ":" + str(tile[0].stop) + ", " + str(tile[1].start) + ":" +
+          str(tile[1].stop) + "...")
+    if tileInterpolators.get("tile") != (interpolators["key"], tile):
+        tileInterpolators.clear()
+        with metrics.stage("geometry"):
+            tileInterpolators.update(buildTileInterpolators(tile))
+
+    h = tileInterpolators["h"]
+    results = {"h": np.broadcast_to(h, (end - start,) + h.shape)}
+    for name in variables:
+        results.update(processVariable(src, name, start, end, tileInterpolators))
+    print("...tile")
+    return results
 
-    print("iDate:" + iDate + " src: " + src + " history: " + history_dir + " dst: " + dst)
 
+def processShared(task):
+    # Worker side: run a task (function, arguments) and hand the results back
+    # through shared memory blocks, with the stage metrics of the task
+    metrics.stages = {}
+    shared = {}
+    function, args = task
+    for key, values in function(*args).items():
+        shm = SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, values.dtype, buffer=shm.buf)[...] = values
+        shared[key] = (shm.name, values.shape, values.dtype.str)
+        shm.close()
+    return shared, metrics.stages
+
+
+def writeShared(roms, shared, start, region=None):
+    # Main process side: the single writer of the archive file
+    for key, (name, shape, dtype) in shared.items():
+        shm = SharedMemory(name=name)
+        roms.writeVariable(key, np.ndarray(shape, dtype, buffer=shm.buf), start, region=region)
+        shm.close()
+        shm.unlink()
+
+
+def buildInterpolators(src, cache, method, dtype, tiles, region):
+    """
+    Build the interpolators of the grid of a source file onto the region,
+    unless the current ones were built for the same grid. With tiles, only the
+    source and the destination grids are kept, for the interpolators of each
+    tile.
+
+    Returns:
+        bool: whether the interpolators were built.
+    """
     # Open the NetCDF file
     ncsrcfile = Dataset(src)
 
     # Read variables
-    time = ncsrcfile.variables["ocean_time"][:]
     Xlat = ncsrcfile["lat_rho"][:]
     Xlon = ncsrcfile["lon_rho"][:]
     Ulat = ncsrcfile["lat_u"][:]
@@ -33,117 +140,222 @@ if __name__ == '__main__':
     mask_u = ncsrcfile["mask_u"][:]
     mask_v = ncsrcfile["mask_v"][:]
     H = ncsrcfile["h"][:]
+    ncsrcfile.close()
+
+    key = GeometryCache.key("rms3", Xlon, Xlat, Ulon, Ulat, Vlon, Vlat, s_rho, mask_rho, mask_u, mask_v, H)
+    if interpolators.get("key") == key:
+        return False
+    interpolators.clear()
+    interpolators["key"] = key
 
     dstLon = np.linspace(Xlon.min(), Xlon.max(), len(Xlon[0]))
     dstLat = np.linspace(Xlat.min(), Xlat.max(), len(Xlat))
 
-    # Instantiate a ROMS archive file
-    roms = ROMS(dst, time, depths, dstLon, dstLat)
+    # The region of interest. The vertical kernels index h with the
+    # destination indices: on a region, h is taken at the points of the whole
+    # grid nearest to its points.
+    lon, lat = region.axes(dstLon, dstLat)
+    dstH = region.subset(H, dstLon, dstLat, lon, lat)
+    dstLon, dstLat = lon, lat
+    interpolators["dstLon"] = dstLon
+    interpolators["dstLat"] = dstLat
+    interpolators["dstH"] = dstH
+
+    if tiles.size:
+        interpolators["source"] = {"lon_rho": Xlon, "lat_rho": Xlat, "lon_u": Ulon, "lat_u": Ulat, "lon_v": Vlon,
+                                   "lat_v": Vlat, "mask_rho": mask_rho, "mask_u": mask_u, "mask_v": mask_v,
+                                   "s_rho": s_rho, "h": H}
+        interpolators["settings"] = (cache, method, dtype, tiles)
+        # The nearest source point of each destination point, which locates
+        # the source window of each tile
+        interpolators["nearest"] = {point: Interp2D(lon, lat, dstLon, dstLat, cache, "nearest", dtype).indices
+                                    for point, lon, lat in (("rho", Xlon, Xlat), ("u", Ulon, Ulat), ("v", Vlon, Vlat))}
+        return True
+
+    # The windows of the source grids covering the region
+    R = region.window(Xlon, Xlat, dstLon, dstLat)
+    U = region.window(Ulon, Ulat, dstLon, dstLat)
+    V = region.window(Vlon, Vlat, dstLon, dstLat)
+    interpolators["windows"] = {"2DRho": R, "3DRho": R, "2DU": U, "3DU": U, "2DV": V, "3DV": V}
 
     # Create a 2D biliniear interpolator on Rho points
-    interpolator2DRho = Interp2D(Xlon, Xlat, dstLon, dstLat)
+    interpolators["2DRho"] = Interp2D(Xlon[R], Xlat[R], dstLon, dstLat, cache, method, dtype)
     # Create a 2D biliniear interpolator on U points
-    interpolator2DU = Interp2D(Ulon, Ulat, dstLon, dstLat)
+    interpolators["2DU"] = Interp2D(Ulon[U], Ulat[U], dstLon, dstLat, cache, method, dtype)
     # Create a 2D biliniear interpolator on V points
-    interpolator2DV = Interp2D(Vlon, Vlat, dstLon, dstLat)
+    interpolators["2DV"] = Interp2D(Vlon[V], Vlat[V], dstLon, dstLat, cache, method, dtype)
 
     # Create a 3D biliniear interpolator on Rho points
-    interpolator3DRho = Interp3D(Xlon, Xlat, dstLon, dstLat, s_rho, mask_rho, H)
+    interpolators["3DRho"] = Interp3D(Xlon[R], Xlat[R], dstLon, dstLat, s_rho, mask_rho[R], dstH, cache, method, dtype)
     # Create a 3D biliniear interpolator on U points
-    interpolator3DU = Interp3D(Ulon, Ulat, dstLon, dstLat, s_rho, mask_u, H)
+    interpolators["3DU"] = Interp3D(Ulon[U], Ulat[U], dstLon, dstLat, s_rho, mask_u[U], dstH, cache, method, dtype)
     # Create a 3D biliniear interpolator on V points
-    interpolator3DV = Interp3D(Vlon, Vlat, dstLon, dstLat, s_rho, mask_v, H)
+    interpolators["3DV"] = Interp3D(Vlon[V], Vlat[V], dstLon, dstLat, s_rho, mask_v[V], dstH, cache, method, dtype)
 
     print("h...")
-    H = interpolator2DRho.interp(H)
+    interpolators["h"] = interpolators["2DRho"].interp(H[R])
     print("...h")
+    return True
 
-    print("zeta...")
-    zeta = ncsrcfile["zeta"][:]
-    zeta = interpolator2DRho.interp(zeta)
-    print("...zeta")
-
-    print("temp...")
-    temp = ncsrcfile["temp"][:]
-    temp = interpolator3DRho.interp(temp)
-    print("...temp")
-
-    print("temp at bottom...")
-    temp_at_bottom = interpolator3DRho.bottomValues(temp)
-    print("...temp at bottom")
-
-    print("temp at surface...")
-    temp_at_surface = interpolator3DRho.surfaceValues(temp)
-    print("...temp at surface")
-
-    print("salt...")
-    salt = ncsrcfile["salt"][:]
-    salt = interpolator3DRho.interp(salt)
-    print("...salt")
-
-    print("salt at bottom...")
-    salt_at_bottom = interpolator3DRho.bottomValues(salt)
-    print("...salt at bottom")
-
-    print("salt at surface...")
-    salt_at_surface = interpolator3DRho.surfaceValues(salt)
-    print("...salt at surface")
-
-    print("U...")
-    u = ncsrcfile["u"][:]
-    u = interpolator3DU.interp(u)
-    print("...U")
-
-    print("U at bottom...")
-    U_at_bottom = interpolator3DRho.bottomValues(u)
-    print("...U at bottom")
-
-    print("U at surface...")
-    U_at_surface = interpolator3DRho.surfaceValues(u, factor=1.2)
-    print("...U at surface")
-
-    print("ubar...")
-    ubar = ncsrcfile["ubar"][:]
-    ubar = interpolator2DU.interp(ubar)
-    print("...ubar")
-
-    print("V...")
-    v = ncsrcfile["v"][:]
-    v = interpolator3DV.interp(v)
-    print("...V")
-
-    print("V at bottom...")
-    V_at_bottom = interpolator3DRho.bottomValues(v)
-    print("...V at bottom")
-
-    print("V at surface...")
-    V_at_surface = interpolator3DRho.surfaceValues(v, factor=1.2)
-    print("...V at surface")
-
-    print("vbar...")
-    vbar = ncsrcfile["vbar"][:]
-    vbar = interpolator2DV.interp(vbar)
-    print("...vbar")
-
-    print("Saving archive file...")
-    roms.h = H
-    roms.temp = temp
-    roms.tempBottom = temp_at_bottom
-    roms.tempSurface = temp_at_surface
-    roms.salt = salt
-    roms.saltBottom = salt_at_bottom
-    roms.saltSurface = salt_at_surface
-    roms.zeta = zeta
-    roms.U = u
-    roms.uBottom = U_at_bottom
-    roms.uSurface = U_at_surface
-    roms.V = v
-    roms.vBottom = V_at_bottom
-    roms.vSurface = V_at_surface
-    roms.ubar = ubar
-    roms.vbar = vbar
-    roms.write()
 
-    # Close the NetCDF file
+def buildTileInterpolators(tile):
+    """
+    Build the interpolators of a tile of the destination grid, from the
+    windows of the source grids covering it.
+
+    Returns:
+        dict: the interpolators by grid, the source window of each, and h.
+    """
+    source = interpolators["source"]
+    cache, method, dtype, tiles = interpolators["settings"]
+    rows, cols = tile
+    dstLon = interpolators["dstLon"][cols]
+    dstLat = interpolators["dstLat"][rows]
+    # The vertical kernels index h with the destination indices, as on the
+    # whole grid
+    H = interpolators["dstH"][rows, cols]
+
+    built = {"tile": (interpolators["key"], tile), "windows": {}}
+    for point, grid in (("rho", "Rho"), ("u", "U"), ("v", "V")):
+        lon = source["lon_" + point]
+        lat = source["lat_" + point]
+        nearest = interpolators["nearest"][point].reshape(len(interpolators["dstLat"]), -1)[rows, cols]
+        window = tiles.window(nearest, np.shape(lon))
+        built["2D" + grid] = Interp2D(lon[window], lat[window], dstLon, dstLat, cache, method, dtype)
+        built["3D" + grid] = Interp3D(lon[window], lat[window], dstLon, dstLat, source["s_rho"],
+                                      source["mask_" + point][window], H, cache, method, dtype)
+        built["windows"]["2D" + grid] = built["windows"]["3D" + grid] = window
+
+    built["h"] = built["2DRho"].interp(source["h"][built["windows"]["2DRho"]])
+    return built
+
+
+def process(iDate, src, history_dir, dst, records, pool, encoding, tiles):
+    print("iDate:" + iDate + " src: " + src + " history: " + history_dir + " dst: " + dst)
+
+    ncsrcfile = Dataset(src)
+    time = ncsrcfile.variables["ocean_time"][:]
     ncsrcfile.close()
-    roms.close()
+
+    dstLon = interpolators["dstLon"]
+    dstLat = interpolators["dstLat"]
+
+    # Instantiate a ROMS archive file
+    with metrics.stage("write"):
+        roms = ROMS(dst, time, depths, dstLon, dstLat, encoding)
+
+    records = records or len(time)
+    if tiles.size:
+        # Tile by tile, all the variables of each record batch, written into
+        # the hyperslab of the tile
+        tasks = [(processTile, (src, tile, start, min(start + records, len(time))))
+                 for tile in tiles.split((len(dstLat), len(dstLon))) for start in range(0, len(time), records)]
+        if pool is None:
+            for function, args in tasks:
+                results = function(*args)
+                with metrics.stage("write"):
+                    for key, values in results.items():
+                        roms.writeVariable(key, values, args[2], region=args[1])
+                del results
+        else:
+            for (_, (_, tile, start, _)), (shared, stages) in zip(tasks, pool.imap(processShared, tasks)):
+                metrics.merge(stages)
+                with metrics.stage("write"):
+                    writeShared(roms, shared, start, tile)
+
+        with metrics.stage("write"):
+            roms.close()
+        return
+
+    # Stream the time records through the interpolators in batches
+    H = interpolators["h"]
+    for start in range(0, len(time), records):
+        end = min(start + records, len(time))
+        print("Records " + str(start) + " to " + str(end - 1) + "...")
+
+        with metrics.stage("write"):
+            roms.writeVariable("h", np.broadcast_to(H, (end - start,) + H.shape), start)
+
+        if pool is None:
+            for name in variables:
+                results = processVariable(src, name, start, end)
+                with metrics.stage("write"):
+                    for key, values in results.items():
+                        roms.writeVariable(key, values, start)
+                del results, values
+        else:
+            # Write each variable as soon as any worker completes it
+            tasks = [(processVariable, (src, name, start, end)) for name in variables]
+            for shared, stages in pool.imap_unordered(processShared, tasks):
+                metrics.merge(stages)
+                with metrics.stage("write"):
+                    writeShared(roms, shared, start)
+
+    # Close the NetCDF file
+    with metrics.stage("write"):
+        roms.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("initialization_date")
+    parser.add_argument("source_file", nargs="+",
+                        help="source files or glob patterns; with several, destination_file is a directory")
+    parser.add_argument("history_dir")
+    parser.add_argument("destination_file")
+    parser.add_argument("--records", type=int, default=None,
+                        help="number of time records processed per batch (default: all)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of variables, or of tiles with --tile, processed concurrently (default: 1)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="number of threads of the vertical interpolation (default: all cores)")
+    parser.add_argument("--method", choices=["nearest", "bilinear", "idw"], default="nearest",
+                        help="horizontal interpolation method (default: nearest)")
+    parser.add_argument("--float32", action="store_true",
+                        help="interpolate in single precision, as the fields are stored")
+    GeometryCache.addArguments(parser)
+    Encoding.addArguments(parser)
+    Tiles.addArguments(parser)
+    Region.addArguments(parser)
+    Profiler.addArguments(parser)
+    Metrics.addArguments(parser)
+    args = parser.parse_args()
+    Profiler.fromArguments(args).start()
+
+    iDate = args.initialization_date
+    history_dir = args.history_dir
+    method = args.method
+    dtype = np.float32 if args.float32 else np.float64
+    cache = GeometryCache.fromArguments(args)
+    encoding = Encoding.fromArguments(args)
+    tiles = Tiles.fromArguments(args)
+    region = Region.fromArguments(args)
+    # Chunk the outputs along the tiles
+    encoding.tile = tiles.size
+    metrics = Metrics.fromArguments(args, "rms3")
+    if args.threads:
+        numba.set_num_threads(args.threads)
+
+    # The interpolators are built for the first file and reused for the others
+    pool = None
+    for src, dst in Batch(args.source_file, args.destination_file):
+        metrics.begin(src)
+        with metrics.stage("geometry"):
+            rebuilt = buildInterpolators(src, cache, method, dtype, tiles, region)
+        if rebuilt and args.workers > 1:
+            # Fork the workers before any output file is open, and again
+            # whenever the grid changes
+            if pool is not None:
+                pool.close()
+                pool.join()
+            # Start the shared memory tracker first, so that the workers share it
+            resource_tracker.ensure_running()
+            pool = multiprocessing.get_context("fork").Pool(args.workers if tiles.size else
+                                                            min(args.workers, len(variables)))
+
+        process(iDate, src, history_dir, dst, args.records, pool, encoding, tiles)
+        metrics.end()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
@@ -0,0 +1,155 @@
+import os
+import sys
+import glob
+import time
+import argparse
+from datetime import datetime, timedelta
+from netCDF4 import Dataset
+from util.Region import Region
+from util.Scheduler import Scheduler
+from util.State import State
+
+# Source files of each product in the run directory
+patterns = {
+    "wrf5": "wrfout_d0*",
+    "rms3": "rms3_*.nc",
+    "wcm3": "wcm3_*.nc",
+    "ww33": "ww33_*.nc",
+}
+
+# The 3D ocean products, whose jobs are capped by --roms-jobs
+heavy = {"rms3", "wcm3"}
+
+
+def get_valid_time(src):
+    with Dataset(src) as ncsrcfile:
+        timeStr = b"".join(ncsrcfile.variables["Times"][0]).decode("UTF-8")
+    return datetime.strptime(timeStr, "%Y-%m-%d_%H:%M:%S")
+
+
+def wrfJobs(scheduler, script, iDate, sources, history, dst_dir, log_dir, options):
+    # Each hour runs after the previous hour and midnight, so that it loads
+    # their interpolated fields from the state directory rather than
+    # recomputing them. The past hours outside the run are looked up in the
+    # history directory; when missing, the first hour of the run stands in
+    # for them, and the deltas start from it.
+    validTimes = {get_valid_time(src): src for src in sources}
+    pastTimes = {}
+    for src in history:
+        try:
+            pastTimes[get_valid_time(src)] = src
+        except (OSError, IndexError, ValueError):
+            continue
+    pastTimes.update(validTimes)
+    first = validTimes[min(validTimes)]
+    for validTime in sorted(validTimes):
+        src = validTimes[validTime]
+        past = []
+        for label, pastTime in (("the previous hour", validTime - timedelta(hours=1)),
+                                ("midnight", datetime(validTime.year, validTime.month, validTime.day, 0, 0, 0))):
+            if pastTime == validTime:
+                past.append(src)
+            elif pastTime in pastTimes:
+                past.append(pastTimes[pastTime])
+            else:
+                print("WARNING *** No wrf5 file for " + label + " of " + os.path.basename(src) + " (" +
+                      str(pastTime) + "): its deltas start from " + os.path.basename(first))
+                past.append(first)
+        src_1hago, src_00 = past
+        name = "wrf5 " + os.path.basename(src)
+        depends = ["wrf5 " + os.path.basename(path) for path in (src_1hago, src_00) if path != src]
+        scheduler.add(name, [sys.executable, script, iDate, src, src_1hago, src_00,
+                             os.path.join(dst_dir, os.path.basename(src))] + options,
+                      os.path.join(log_dir, os.path.basename(src) + ".log"), depends)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Postprocess every hourly file of a run directory, running the per-file jobs of the products "
+                    "over a pool of processes.")
+    parser.add_argument("initialization_date")
+    parser.add_argument("run_dir", help="directory of the source files of the run")
+    parser.add_argument("destination_dir", help="the outputs go to a subdirectory per product")
+    parser.add_argument("--products", nargs="+", choices=list(patterns), default=list(patterns),
+                        help="products to postprocess (default: all those with files in run_dir)")
+    parser.add_argument("--pattern", action="append", default=[], metavar="PRODUCT=GLOB",
+                        help="source files of a product, relative to run_dir (default: " +
+                             ", ".join(product + "=" + pattern for product, pattern in patterns.items()) + ")")
+    parser.add_argument("--history-dir", default=None,
+                        help="history directory of rms3, wcm3 and ww33, and of the wrf5 files of the previous "
+                             "hour and midnight outside the run (default: run_dir)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of jobs run concurrently (default: all cores)")
+    parser.add_argument("--roms-jobs", type=int, default=1,
+                        help="number of concurrent rms3 and wcm3 jobs, the memory heavy ones (default: 1)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="numba threads of each job (default: the cores divided among the jobs)")
+    parser.add_argument("--method", choices=["nearest", "bilinear", "idw"], default="nearest",
+                        help="horizontal interpolation method (default: nearest)")
+    parser.add_argument("--float32", action="store_true",
+                        help="interpolate in single precision, as the fields are stored")
+    State.addArguments(parser)
+    Region.addArguments(parser)
+    args = parser.parse_args()
+    Region.fromArguments(args)
+
+    for pattern in args.pattern:
+        product, _, value = pattern.partition("=")
+        if product not in patterns or not value:
+            parser.error("--pattern expects PRODUCT=GLOB, with PRODUCT one of " + ", ".join(patterns))
+        patterns[product] = value
+
+    history_dir = args.history_dir or args.run_dir
+    log_dir = os.path.join(args.destination_dir, "logs")
+    # The state directory carries the WRF fields from a job to the next hours
+    state_dir = args.state_dir or os.path.join(args.destination_dir, "state")
+
+    options = ["--method", args.method] + (["--float32"] if args.float32 else [])
+    if args.bbox:
+        options += ["--bbox"] + [str(value) for value in args.bbox] + ["--bbox-margin", str(args.bbox_margin)]
+    if args.resolution:
+        options += ["--resolution", str(args.resolution)]
+    threads = args.threads or max(1, os.cpu_count() // max(1, args.jobs))
+    env = dict(os.environ, NUMBA_NUM_THREADS=str(threads))
+    scheduler = Scheduler(args.jobs, args.roms_jobs, env)
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    # The WRF chain first, since it is the longest, then the heavy jobs
+    for product in sorted(args.products, key=lambda product: (product != "wrf5", product not in heavy)):
+        sources = sorted(glob.glob(os.path.join(args.run_dir, patterns[product])))
+        if not sources:
+            continue
+        script = os.path.join(here, "postpro-" + product + ".py")
+        dst_dir = os.path.join(args.destination_dir, product)
+        os.makedirs(dst_dir, exist_ok=True)
+        print(product + ": " + str(len(sources)) + " files")
+        if product == "wrf5":
+            history = sorted(set(glob.glob(os.path.join(history_dir, patterns[product]))) - set(sources))
+            wrfJobs(scheduler, script, args.initialization_date, sources, history, dst_dir,
+                    os.path.join(log_dir, product), options + ["--state-dir", state_dir])
+            continue
+        for src in sources:
+            scheduler.add(product + " " + os.path.basename(src),
+                          [sys.executable, script, args.initialization_date, src, history_dir,
+                           os.path.join(dst_dir, os.path.basename(src))] + options,
+                          os.path.join(log_dir, product, os.path.basename(src) + ".log"),
+                          heavy=product in heavy)
+
+    start = time.perf_counter()
+    results = scheduler.run()
+    elapsed = time.perf_counter() - start
+
+    failed = [name for name, (status, _) in results.items() if status != 0]
+    files = len(results) - len(failed)
+    print("Processed " + str(files) + " files in " + "%.1f" % elapsed + " s: " +
+          "%.1f" % (files * 60.0 / max(elapsed, 1e-9)) + " files per minute, " + str(args.jobs) + " jobs of " +
+          str(threads) + " threads")
+    for product in args.products:
+        times = [seconds for name, (status, seconds) in results.items()
+                 if status == 0 and name.startswith(product + " ")]
+        if times:
+            print("  " + product + ": " + str(len(times)) + " files, " + "%.1f" % (sum(times) / len(times)) +
+                  " s per file")
+    if failed:
+        print("Failed: " + ", ".join(failed))
+        sys.exit(1)
@@ -0,0 +1,51 @@
+import time
+
+start = time.time()
+
+import argparse
+import numpy as np
+from util import Interpolator
+
+elapsed = time.time() - start
+
+# The numba kernels, compiled for every signature when util.Interpolator is imported
+kernels = [Interpolator.bottom_levels, Interpolator.vertical_weights, Interpolator.vertical_interp,
+           Interpolator.depth_integrals, Interpolator.vertical_levels_interp]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Build the numba kernels and store them in the on-disk cache, so that the postprocessing "
+                    "runs do not compile them. Run it at deploy time, with the same NUMBA_CACHE_DIR as the runs.")
+    parser.parse_args()
+
+    for kernel in kernels:
+        hits = sum(kernel.stats.cache_hits.values())
+        misses = sum(kernel.stats.cache_misses.values())
+        print(kernel.__name__ + ": " + str(len(kernel.signatures)) + " signatures, " +
+              str(hits) + " loaded from the cache, " + str(misses) + " compiled")
+
+    # Call each kernel on a single water column, with writable and with
+    # read-only arrays (as the memory-mapped geometry cache loads them), so
+    # that a signature mismatch fails here
+    for dtype in (np.float64, np.float32):
+        for writeable in (True, False):
+            def array(values):
+                values = np.array(values)
+                values.setflags(write=writeable)
+                return values
+
+            s_rho = array(np.linspace(-0.95, -0.05, 3).astype(dtype))
+            variable = array(np.ones((1, 3, 1, 1), dtype))
+            H = array(np.full((1, 1), 10, dtype))
+            mask_indices = tuple(array(np.zeros((2, 1), np.int64)))
+            depths = array(Interpolator.levels)
+            bottom = Interpolator.bottom_levels(s_rho, depths, mask_indices, H)
+            offsets = array(np.concatenate(([0], np.cumsum(bottom + 1))))
+            lower, weights = Interpolator.vertical_weights(s_rho, depths, mask_indices, H, offsets)
+            Interpolator.vertical_interp(variable, mask_indices, offsets, array(lower), array(weights), len(depths),
+                                         dtype(1), dtype(1e37))
+            Interpolator.depthIntegrals(variable, [10.0], mask_indices)
+            Interpolator.interplevels(variable[0][None], s_rho[:, None, None], [-0.5])
+
+    print("Startup: " + "%.2f" % elapsed + " s (imports and kernels)")
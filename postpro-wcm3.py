@@ -1,101 +1,216 @@
-import sys
+import argparse
+import numba
 import numpy as np
 from netCDF4 import Dataset
-from util.Interpolator import Interp2D, Interp3D, depths
+from util.Profiler import Profiler
+from util.Batch import Batch
+from util.Encoding import Encoding
+from util.GeometryCache import GeometryCache
+from util.Metrics import Metrics
+from util.Interpolator import Interp2D, Interp3D, depthIntegrals, depths
+from util.Region import Region
+from util.Tiles import Tiles
 from util.Wacomm import Wacomm
 
 
-def compute_sfconc(conc, depth_limit, mask2d, depths, fill_value=1e37):
-    """
-    Compute the vertical sum of concentration up to a given depth,
-    ignoring fill values and masked areas.
+# Surface concentration products: the integral of conc down to a depth (m)
+sfconcDepths = {"sfconc10m": 10.0, "sfconc30m": 30.0}
 
-    Parameters:
-        conc (np.ndarray): 3D concentration array with shape (depth, lat, lon).
-        depth_limit (float): Maximum depth (in meters) for the integration.
-        mask2d (np.ndarray): 2D mask of shape (lat, lon) with 1 for water, 0 for land.
-        depths (list or np.ndarray): List of depth levels corresponding to the first axis of `conc`.
-        fill_value (float): Value used to indicate missing or invalid data.
 
-    Returns:
-        np.ndarray: 2D array (lat, lon) containing the summed concentration
-                    from the surface down to `depth_limit`.
-    """
-    # Ensure depths is a NumPy array
-    depth_arr = np.array(depths)
+# Interpolators by source grid, reused across the files of a batch
+interpolators = {}
 
-    # Create boolean mask of levels <= depth_limit
-    depth_mask = depth_arr <= depth_limit  # shape (n_depths,)
 
-    # Expand spatial mask to 3D and combine with depth mask
-    mask3d = depth_mask[:, None, None] * mask2d[None, :, :]
+def destinationGrid(ncsrcfile, region):
+    """
+    The destination grid on the region, and h at its points as the vertical
+    kernels index it, with the destination indices: on a region, at the
+    points of the whole grid nearest to its points.
 
-    # Replace fill values with zero so they don’t inflate the sum
-    conc_clean = np.where(conc == fill_value, 0.0, conc)
+    Returns:
+        tuple: the longitudes, the latitudes and h.
+    """
+    Xlat = ncsrcfile["lat_rho"][:]
+    Xlon = ncsrcfile["lon_rho"][:]
+    H = ncsrcfile["h"][:]
+    dstLon = np.linspace(Xlon.min(), Xlon.max(), len(Xlon[0]))
+    dstLat = np.linspace(Xlat.min(), Xlat.max(), len(Xlat))
+    lon, lat = region.axes(dstLon, dstLat)
+    return lon, lat, region.subset(H, dstLon, dstLat, lon, lat)
 
-    # Sum along the depth axis
-    sfconc = np.sum(conc_clean * mask3d, axis=0)  # shape (lat, lon)
 
-    # Restore fill_value on land points
-    sfconc[mask2d == 0] = fill_value
+def gridKey(ncsrcfile):
+    # The source grid, which keys the interpolators of a batch
+    return GeometryCache.key("wcm3", ncsrcfile["lon_rho"][:], ncsrcfile["lat_rho"][:], ncsrcfile["s_rho"][:],
+                             ncsrcfile["mask_rho"][:], ncsrcfile["h"][:])
 
-    return sfconc
 
+def interpolator(ncsrcfile, cache, method, dtype, region):
+    key = gridKey(ncsrcfile)
+    if key not in interpolators:
+        Xlat = ncsrcfile["lat_rho"][:]
+        Xlon = ncsrcfile["lon_rho"][:]
+        s_rho = ncsrcfile["s_rho"][:]
+        mask_rho = ncsrcfile["mask_rho"][:]
+        # The region of interest, from the window of the source grid covering it
+        dstLon, dstLat, dstH = destinationGrid(ncsrcfile, region)
+        window = region.window(Xlon, Xlat, dstLon, dstLat)
+        interpolators[key] = (window, Interp3D(Xlon[window], Xlat[window], dstLon, dstLat, s_rho, mask_rho[window],
+                                               dstH, cache, method, dtype))
+    return interpolators[key]
 
-if __name__ == '__main__':
-    if len(sys.argv) != 5:
-        print("Usage: python " + str(sys.argv[0]) + " initialization_date source_file history_dir destination_file")
-        sys.exit(-1)
 
-    iDate = sys.argv[1]
-    src = sys.argv[2]
-    history_dir = sys.argv[3]
-    dst = sys.argv[4]
+def tileInterpolators(ncsrcfile, cache, method, dtype, tiles, region):
+    """
+    The tiles of the destination grid, each as its (latitude, longitude)
+    slices, the window of the source grid covering it and a function building
+    its interpolator; without tiles, the whole grid and its interpolator.
 
-    print("iDate:" + iDate + " src: " + src + " history: " + history_dir + " dst: " + dst)
+    The tiles and their interpolators, once built, are reused for the files
+    of a batch with the same grid.
+    """
+    if not tiles.size:
+        window, interpolator3D = interpolator(ncsrcfile, cache, method, dtype, region)
+        return [(None, window, lambda: interpolator3D)]
 
-    # Open the NetCDF file
-    ncsrcfile = Dataset(src)
+    key = gridKey(ncsrcfile)
+    if key in interpolators:
+        return interpolators[key]
 
-    # Read variables
-    time = ncsrcfile.variables["ocean_time"][:]
     Xlat = ncsrcfile["lat_rho"][:]
     Xlon = ncsrcfile["lon_rho"][:]
     s_rho = ncsrcfile["s_rho"][:]
     mask_rho = ncsrcfile["mask_rho"][:]
-    H = ncsrcfile["h"][:]
+    dstLon, dstLat, H = destinationGrid(ncsrcfile, region)
 
-    dstLon = np.linspace(Xlon.min(), Xlon.max(), len(Xlon[0]))
-    dstLat = np.linspace(Xlat.min(), Xlat.max(), len(Xlat))
+    # The nearest source point of each destination point locates the source
+    # window of each tile
+    nearest = Interp2D(Xlon, Xlat, dstLon, dstLat, cache, "nearest", dtype).indices.reshape(len(dstLat), len(dstLon))
+    windows = [(tile, tiles.window(nearest[tile], np.shape(Xlon))) for tile in tiles.split(nearest.shape)]
 
-    # Instantiate a Wacomm archive file
-    wacomm = Wacomm(dst, time, depths, dstLon, dstLat)
+    built = {}
+
+    def build(index):
+        # The vertical kernels index h with the destination indices, as on
+        # the whole grid
+        if index not in built:
+            tile, window = windows[index]
+            rows, cols = tile
+            built[index] = Interp3D(Xlon[window], Xlat[window], dstLon[cols], dstLat[rows], s_rho, mask_rho[window],
+                                    H[tile], cache, method, dtype)
+        return built[index]
+
+    interpolators[key] = [(tile, window, lambda index=index: build(index))
+                          for index, (tile, window) in enumerate(windows)]
+    return interpolators[key]
 
-    # Create a 2D biliniear interpolator on Rho points
-    interpolator2DRho = Interp2D(Xlon, Xlat, dstLon, dstLat)
 
-    # Create a 3D biliniear interpolator on Rho points
-    interpolator3DRho = Interp3D(Xlon, Xlat, dstLon, dstLat, s_rho, mask_rho, H)
+def process(iDate, src, history_dir, dst, records, cache, method, dtype, encoding, tiles, region, metrics):
+    print("iDate:" + iDate + " src: " + src + " history: " + history_dir + " dst: " + dst)
+    metrics.begin(src)
+
+    # Open the NetCDF file
+    with metrics.stage("read"):
+        ncsrcfile = Dataset(src)
 
-    print("conc...")
-    conc = ncsrcfile.variables["conc"][:]
-    conc = interpolator3DRho.interp(conc)
-    print("...conc")
+        # Read variables
+        time = ncsrcfile.variables["ocean_time"][:]
 
-    print("sfconc...")
-    sfconc = conc[0, 0]
-    sfconc_10m = compute_sfconc(conc[0], 10.0, interpolator3DRho.mask, depths)
-    sfconc_30m = compute_sfconc(conc[0], 30.0, interpolator3DRho.mask, depths)
-    print("...sfconc")
+    # The destination grid and its tiles, or the whole grid as a single one
+    with metrics.stage("geometry"):
+        dstLon, dstLat, _ = destinationGrid(ncsrcfile, region)
+        tileList = tileInterpolators(ncsrcfile, cache, method, dtype, tiles, region)
 
-    print("Saving archive file...")
-    wacomm.mask = interpolator3DRho.mask
-    wacomm.conc = conc
-    wacomm.sfconc = sfconc
-    wacomm.sfconc_10m = sfconc_10m
-    wacomm.sfconc_30m = sfconc_30m
-    wacomm.write()
+    # Instantiate a Wacomm archive file
+    with metrics.stage("write"):
+        wacomm = Wacomm(dst, time, depths, dstLon, dstLat, encoding)
+
+    records = records or len(time)
+    for tile, window, build in tileList:
+        if tile is not None:
+            print("Tile " + str(tile[0].start) + ":" + str(tile[0].stop) + ", " + str(tile[1].start) + ":" +
+                  str(tile[1].stop) + "...")
+
+        # Create, or reuse, the 3D biliniear interpolator on Rho points
+        with metrics.stage("geometry"):
+            interpolator3DRho = build()
+        with metrics.stage("write"):
+            wacomm.writeVariable("mask", interpolator3DRho.mask, region=tile)
+
+        # Stream the time records through the interpolators in batches
+        for start in range(0, len(time), records):
+            end = min(start + records, len(time))
+            print("Records " + str(start) + " to " + str(end - 1) + "...")
+
+            print("conc...")
+            with metrics.stage("read"):
+                # Only the window of the source grid covering the region or the tile
+                conc = ncsrcfile.variables["conc"][(slice(start, end), Ellipsis) + window]
+            with metrics.stage("horizontal"):
+                conc = interpolator3DRho.interpLevels(conc)
+            with metrics.stage("vertical"):
+                conc = interpolator3DRho.verticalFields(conc)[0]
+            print("...conc")
+
+            print("sfconc...")
+            with metrics.stage("reductions"):
+                sfconc = depthIntegrals(conc, list(sfconcDepths.values()), interpolator3DRho.mask_indices, depths)
+            with metrics.stage("write"):
+                wacomm.writeVariable("sfconc", conc[:, 0], start, region=tile)
+                for name, values in zip(sfconcDepths, sfconc):
+                    wacomm.writeVariable(name, values, start, region=tile)
+            del sfconc
+            print("...sfconc")
+
+            with metrics.stage("write"):
+                wacomm.writeVariable("conc", conc, start, region=tile)
+            del conc
 
     # Close the NetCDF file
     ncsrcfile.close()
-    wacomm.close()
+    with metrics.stage("write"):
+        wacomm.close()
+    metrics.end()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("initialization_date")
+    parser.add_argument("source_file", nargs="+",
+                        help="source files or glob patterns; with several, destination_file is a directory")
+    parser.add_argument("history_dir")
+    parser.add_argument("destination_file")
+    parser.add_argument("--records", type=int, default=None,
+                        help="number of time records processed per batch (default: all)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="number of threads of the vertical interpolation (default: all cores)")
+    parser.add_argument("--method", choices=["nearest", "bilinear", "idw"], default="nearest",
+                        help="horizontal interpolation method (default: nearest)")
+    parser.add_argument("--float32", action="store_true",
+                        help="interpolate in single precision, as the fields are stored")
+    GeometryCache.addArguments(parser)
+    Encoding.addArguments(parser)
+    Tiles.addArguments(parser)
+    Region.addArguments(parser)
+    Profiler.addArguments(parser)
+    Metrics.addArguments(parser)
+    args = parser.parse_args()
+    Profiler.fromArguments(args).start()
+
+    iDate = args.initialization_date
+    history_dir = args.history_dir
+    method = args.method
+    dtype = np.float32 if args.float32 else np.float64
+    cache = GeometryCache.fromArguments(args)
+    encoding = Encoding.fromArguments(args)
+    tiles = Tiles.fromArguments(args)
+    region = Region.fromArguments(args)
+    # Chunk the outputs along the tiles
+    encoding.tile = tiles.size
+    metrics = Metrics.fromArguments(args, "wcm3")
+    if args.threads:
+        numba.set_num_threads(args.threads)
+
+    # The interpolators are built for the first file and reused for the others
+    for src, dst in Batch(args.source_file, args.destination_file):
+        process(iDate, src, history_dir, dst, args.records, cache, method, dtype, encoding, tiles, region, metrics)
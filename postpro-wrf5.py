@@ -1,12 +1,20 @@
-import sys
+import argparse
 import numpy as np
 import math
 from os.path import basename
 from netCDF4 import Dataset
 from datetime import timedelta, datetime
-from wrf import getvar, interplevel
+from wrf import getvar
+from util.Profiler import Profiler
 from util.WRF import WRF
-from util.Interpolator import Interp2D
+from util.Batch import Batch
+from util.Encoding import Encoding
+from util.GeometryCache import GeometryCache
+from util.Graph import Graph
+from util.Metrics import Metrics
+from util.State import State
+from util.Interpolator import Interp2D, interplevels
+from util.Region import Region
 
 
 def get_date_time(date):
@@ -83,43 +91,15 @@ def getBoundaries(Xlon, Xlat):
     return minLon, minLat, maxLon, maxLat
 
 
-if __name__ == '__main__':
-    if len(sys.argv) != 6:
-        print("Usage: python " + str(sys.argv[0]) + " initialization_date source_file source_file_1hago source_file_00 destination_file")
-        sys.exit(-1)
-
-    iDate = sys.argv[1]
-    src = sys.argv[2]
-    src_1hago = sys.argv[3]
-    src_00 = sys.argv[4]
-    dst = sys.argv[5]
-
-    print("iDate:" + iDate + " src: " + src + " dst: " + dst)
-
-    # Open the NetCDF file
-    ncsrcfile = Dataset(src)
-
+def get_valid_time(ncsrcfile):
     timeVariable = [el.decode('UTF-8') for el in ncsrcfile.variables["Times"][:][0]]
     datetimeStr = ''.join(timeVariable).split("_")
     dateStr = datetimeStr[0].split("-")
     timeStr = datetimeStr[1].split(":")
-    
-    datetime_current = datetime(int(dateStr[0]), int(dateStr[1]), int(dateStr[2]), int(timeStr[0]), int(timeStr[1]), int(timeStr[2]))
-    datetime_1h_ago = datetime_current - timedelta(hours=1)
-    datetime_00 = datetime(int(dateStr[0]), int(dateStr[1]), int(dateStr[2]), 0, 0, 0)
-
-    time = [ datetime_current ]
-    print("Dates -- current: " + str(datetime_current) + " 1h ago: " + str(datetime_1h_ago) + " today: " + str(datetime_00))
-
-    #src_1hago = history_dir + "/" + get_date_time_path(datetime_1h_ago) + "/" + prod + "_" + domain + "_" + get_date_time(datetime_1h_ago) + ".nc"
-    #src_00 = history_dir + "/" + get_date_time_path(datetime_00) + "/" + prod + "_" + domain + "_" + get_date_time(datetime_00) + ".nc"
+    return datetime(int(dateStr[0]), int(dateStr[1]), int(dateStr[2]), int(timeStr[0]), int(timeStr[1]), int(timeStr[2]))
 
-    print("Prev       : " + str(src_1hago))
-    print("Current day: " + str(src_00))
-
-    Xlat = np.array(getvar(ncsrcfile, "XLAT", meta=False))
-    Xlon = np.array(getvar(ncsrcfile, "XLONG", meta=False))
 
+def destinationGrid(Xlon, Xlat, DX, DY):
     lon = np.average(Xlon)
     lat = np.average(Xlat)
 
@@ -127,8 +107,8 @@ if __name__ == '__main__':
     R = 6378137
 
     #offsets in meters
-    dn = ncsrcfile.DY
-    de = ncsrcfile.DX
+    dn = DY
+    de = DX
 
     #Coordinate offsets in degrees
     dLat = 0.5 * (dn/R) * 180/math.pi
@@ -143,459 +123,319 @@ if __name__ == '__main__':
     # create the longitude array
     dstLon =  np.arange(minLon, maxLon, dLon)
 
-    # Instantiate a WRF archive file
-    wrf = WRF(dst, time, dstLon, dstLat)
-
-    # Create a 2D biliniear interpolator on Rho points
-    interpolator2DRho = Interp2D(Xlon, Xlat, dstLon, dstLat)
-
-    # Extract the pressure, geopotential height, temperature
-    p = getvar(ncsrcfile, "pressure")
-    z = getvar(ncsrcfile, "z", units="dm")
-    tc = getvar(ncsrcfile, "temp", units="degC")
-    td = getvar(ncsrcfile, "td", units="degC")
-    ter = getvar(ncsrcfile,"ter", units="m")
-    theta_e= getvar(ncsrcfile, "theta_e", units="degC")
-    theta_w = getvar(ncsrcfile, "twb", units="degC")
-    rh = getvar(ncsrcfile, "rh")
-    uvmet = getvar(ncsrcfile, "uvmet")
-    tc1000  = interplevel(tc, p, 1000)
-    rh1000  = interplevel(rh, p, 1000)
-    u1000  = interplevel(uvmet[0], p, 1000)
-    v1000  = interplevel(uvmet[1], p, 1000)
-    tc975  = interplevel(tc, p, 975)
-    rh975  = interplevel(rh, p, 975)
-    u975  = interplevel(uvmet[0], p, 975)
-    v975  = interplevel(uvmet[1], p, 975)
-    tc950 = interplevel(tc, p, 950)
-    rh950  = interplevel(rh, p, 950)
-    u950  = interplevel(uvmet[0], p, 950)
-    v950  = interplevel(uvmet[1], p, 950)
-    tc925  = interplevel(tc, p, 925)
-    rh925  = interplevel(rh, p, 925)
-    u925  = interplevel(uvmet[0], p, 925)
-    v925  = interplevel(uvmet[1], p, 925)
-    gph850 = interplevel(z, p, 850)
-    theta_e850 = interplevel(theta_e, p, 850)
-    theta_w850 = interplevel(theta_w, p, 850)
-    td850 = interplevel(td, p, 850)
-    tc850 = interplevel(tc, p, 850)
-    rh850  = interplevel(rh, p, 850)
-    u850  = interplevel(uvmet[0], p, 850)
-    v850  = interplevel(uvmet[1], p, 850)
-    td700 = interplevel(td, p, 700)
-    tc700 = interplevel(tc, p, 700)
-    rh700  = interplevel(rh, p, 700)
-    u700  = interplevel(uvmet[0], p, 700)
-    v700  = interplevel(uvmet[1], p, 700)
-    theta_e500 = interplevel(theta_e, p, 500)
-    gph500 = interplevel(z, p, 500)
-    tc500 = interplevel(tc, p, 500)
-    rh500  = interplevel(rh, p, 500)
-    u500  = interplevel(uvmet[0], p, 500)
-    v500  = interplevel(uvmet[1], p, 500)
-    tc300 = interplevel(tc, p, 300)
-    rh300  = interplevel(rh, p, 300)
-    u300  = interplevel(uvmet[0], p, 300)
-    v300  = interplevel(uvmet[1], p, 300)
-    tt = tc850 + td850 - 2*tc500  
-    ki = (tc850-tc500)+td850-(tc700-td700)
-    delta_theta = theta_e500-theta_e850
-    cape_2d = getvar(ncsrcfile, "cape_2d", meta=False)
-    updraft_helicity = getvar(ncsrcfile, "updraft_helicity", meta=False)
-    helicity = getvar(ncsrcfile, "helicity", meta=False)
-    # Get the sea level pressure
-    slp = getvar(ncsrcfile, "slp", meta=False)
-    rh2 = getvar(ncsrcfile, "rh2", meta=False)
-    pw = getvar(ncsrcfile, "pw", meta=False)
-    # Cloud fraction as the maximum of the low and mid layers
-    cloudfrac = getvar(ncsrcfile, "cloudfrac", meta=False)
-    clf = np.maximum(cloudfrac[0], cloudfrac[1])
-    # Read the temperature at 2m in celsius
-    t2c = ncsrcfile["T2"][:] - 273.15
-    # Read the snow rate
-    sr = ncsrcfile["SR"][:]
-    # Get the wind at 10m u and v components (meteo oriented)
-    uvmet10 = getvar(ncsrcfile, "uvmet10", meta=False)
-    # Get the wind speed and wind dir at 10m (meteo oriented)
-    uvmet10_wspd_wdir = getvar(ncsrcfile, "uvmet10_wspd_wdir", meta=False)
-    # Read the simulation cumulated rain from the current file
-    rain = ncsrcfile["RAINC"][:] + ncsrcfile["RAINNC"][:] + ncsrcfile["RAINSH"][:]
-
-    # Set to none the h00 (daily) interpolated values
-    raini_00 = None
-    wspd10i_00 = None
-    wdir10i_00 = None
-
-    # Interpolate the cumulated rain
-    print("rain...")
-    raini = interpolator2DRho.interp(rain[0])
-    print("...rain")
-
-    # Interpolate the snow rate
-    print("sr...")
-    sri = interpolator2DRho.interp(sr[0])
-    print("...sr")
-
-    # Interpolate wind speed and wind dir at 10m
-    print("wspd10i...")
-    wspd10i = interpolator2DRho.interp(uvmet10_wspd_wdir[0])
-    print("...wspd10i")
-
-    print("wdir10i...")
-    wdir10i = interpolator2DRho.interp(uvmet10_wspd_wdir[1])
-    print("...wdir10i")
-
-    try:
-        # Try to open the previous hour dataset
-        ncsrc_00 = Dataset(src_00)
-
-        print("Calculating daily deltas...")
-
-        # Read the simulation cumulated rain from the current file
-        rain_00 = ncsrc_00["RAINC"][:] + ncsrc_00["RAINNC"][:] + ncsrc_00["RAINSH"][:]
-
-        # Interpolate the cumulated rain
-        print("raini_00...")
-        raini_00 = interpolator2DRho.interp(rain_00[0])
-        print("...raini_00")
-
-        # Close the dataset
-        ncsrc_00.close()
-
-        print("...done with daily processing.")
-    except Exception as e:
-        # If not previous hour, just calculate from 0
-        print("WARNING *** Troubles with the daily dataset: " + src_00)
-        print(e)
-
-        # Hourly rain
-        raini_00 = raini
+    return {"dstLon": dstLon, "dstLat": dstLat}
 
-    # Calculate the hourly cumulated rain
-    print("Daily Rain...")
-    draini = raini - raini_00
 
-    # Set to none the 1 hour ago interpolated values
-    raini_1hago = None
-    wspd10i_1hago = None
-    wdir10i_1hago = None
+# Pressure levels and the 3D fields interpolated on them
+levels = [1000, 975, 950, 925, 850, 700, 500, 300]
+levelFields = ["tc", "rh", "u", "v", "z", "theta_e", "theta_w", "td"]
 
-    try:
-        # Try to open the previous hour dataset
-        ncsrc_1hago = Dataset(src_1hago)
+# Named groups of output variables, selectable with --variables
+products = {
+    "rain": ["DELTA_RAIN", "DAILY_RAIN", "HOURLY_SWE"],
+    "wind10": ["U10M", "V10M", "WSPD10", "WDIR10", "DELTA_WSPD10", "DELTA_WDIR10"],
+    "surface": ["T2C", "RH2", "PW", "SLP", "CLDFRA_TOTAL"],
+    "convection": ["MCAPE", "MCIN", "UH", "SRH", "TT", "KI", "DELTA_THETA", "THETA_E850", "THETA_W850"],
+    "levels": [prefix + str(level) for level in levels for prefix in ("U", "V", "TC", "RH")] + ["GPH500", "GPH850"],
+}
 
-        print("Calculating 1 hour ago deltas...")
+# Interpolators by source grid, reused across the files of a batch
+interpolators = {}
 
-        # Read the simulation cumulated rain from the current file
-        rain_1hago = ncsrc_1hago["RAINC"][:] + ncsrc_1hago["RAINNC"][:] + ncsrc_1hago["RAINSH"][:]
 
-        # Interpolate the cumulated rain
-        print("raini_1hago...")
-        raini_1hago = interpolator2DRho.interp(rain_1hago[0])
-        print("...raini_1hago")
+def interpolator(ncsrcfile, cache, method, dtype, region):
+    Xlat = np.array(getvar(ncsrcfile, "XLAT", meta=False))
+    Xlon = np.array(getvar(ncsrcfile, "XLONG", meta=False))
 
+    key = GeometryCache.key("wrf5", Xlon, Xlat, np.array([ncsrcfile.DX, ncsrcfile.DY]))
+    if key not in interpolators:
+        if cache is None:
+            grid = destinationGrid(Xlon, Xlat, ncsrcfile.DX, ncsrcfile.DY)
+        else:
+            grid = cache.fetch(key, lambda: destinationGrid(Xlon, Xlat, ncsrcfile.DX, ncsrcfile.DY))
+        # The region of interest, from the window of the source grid covering it
+        dstLon, dstLat = region.axes(grid["dstLon"], grid["dstLat"])
+        window = region.window(Xlon, Xlat, dstLon, dstLat)
+        interpolators[key] = (window, Interp2D(Xlon[window], Xlat[window], dstLon, dstLat, cache, method, dtype))
+    return interpolators[key]
+
+
+def recomputeFields(src, names, window, interpolator2DRho):
+    # The interpolated fields of a past hour, from its dataset, over the
+    # window of the source grid
+    window = (Ellipsis,) + window
+    ncsrc = Dataset(src)
+    fields = {}
+    if "rain" in names:
+        # Read the simulation cumulated rain
+        rain = ncsrc["RAINC"][window] + ncsrc["RAINNC"][window] + ncsrc["RAINSH"][window]
+        fields["rain"] = interpolator2DRho.interp(rain[0])
+    if "wspd10" in names or "wdir10" in names:
         # Get the wind speed and wind dir at 10m (meteo oriented)
-        uvmet10_wspd_wdir_1hago = getvar(ncsrc_1hago, "uvmet10_wspd_wdir", meta=False)
-
-        # Interpolate wind speed and wind dir at 10m
-        print("wspd10i_1hago...")
-        wspd10i_1hago = interpolator2DRho.interp(uvmet10_wspd_wdir_1hago[0])
-        print("...wspd10i_1hago")
-
-        print("wdir10i_1hago...")
-        wdir10i_1hago = interpolator2DRho.interp(uvmet10_wspd_wdir_1hago[1])
-        print("...wdir10i_1hago")
-
-        # Close the dataset
-        ncsrc_1hago.close()
-
-        print("...done with 1 hour ago processing.")
-    except:
-        # If not previous hour, just calculate from 0
-        print("WARNING *** Troubles with the previous dataset: " + src_1hago)
-
-        # Hourly rain
-        raini_1hago = raini
+        uvmet10_wspd_wdir = getvar(ncsrc, "uvmet10_wspd_wdir", meta=False)[window]
+        fields["wspd10"] = interpolator2DRho.interp(uvmet10_wspd_wdir[0])
+        fields["wdir10"] = interpolator2DRho.interp(uvmet10_wspd_wdir[1])
+    ncsrc.close()
+    return fields
 
-        # Wind shift
-        wspd10i_1hago = wspd10i
-        wdir10i_1hago = wdir10i
 
-    # Calculate the hourly cumulated rain
-    print("Rain...")
-    hraini = raini - raini_1hago
-
-    # Calculate the wind shift
-    print("Wind shift...")
-    dwspd10i = wspd10i - wspd10i_1hago
-    dwdir10i = wdir10i - wdir10i_1hago
-
-    # Calc snow water equivalent
+def snowWaterEquivalent(hraini, sri):
     hswei = np.array(hraini * (sri - 0.75) * 5)
     hswei[hswei < 0] = 0
+    return hswei
 
-    print("pw...")
-    pw = interpolator2DRho.interp(pw)
-    print("...pw")
-
-    print("rh2...")
-    rh2 = interpolator2DRho.interp(rh2)
-    print("...rh2")
-
-    print("t2c...")
-    t2c = interpolator2DRho.interp(t2c[0])
-    print("...t2c")
-
-    print("uh...")
-    uh = interpolator2DRho.interp(updraft_helicity)
-    print("...uh")
-
-    print("srh...")
-    srh = interpolator2DRho.interp(helicity)
-    print("...srh")
 
-    print("mcape...")
-    mcape = interpolator2DRho.interp(cape_2d[0])
-    print("...mcape")
-
-    print("mcin...")
-    mcin = interpolator2DRho.interp(cape_2d[1])
-    print("...mcin")
-
-    print("u1000...")
-    u1000 = interpolator2DRho.interp(u1000)
-    print("...u1000")
-
-    print("v1000...")
-    v1000 = interpolator2DRho.interp(v1000)
-    print("...v1000")
-
-    print("tc1000...")
-    tc1000 = interpolator2DRho.interp(tc1000)
-    print("...tc1000")
-
-    print("rh1000...")
-    rh1000 = interpolator2DRho.interp(rh1000)
-    print("...rh1000")
-
-    print("u975...")
-    u975 = interpolator2DRho.interp(u975)
-    print("...u975")
-
-    print("v975...")
-    v975 = interpolator2DRho.interp(v975)
-    print("...v975")
-
-    print("tc975...")
-    tc975 = interpolator2DRho.interp(tc975)
-    print("...tc975")
-
-    print("rh975...")
-    rh975 = interpolator2DRho.interp(rh975)
-    print("...rh975")
-
-    print("u950...")
-    u950 = interpolator2DRho.interp(u950)
-    print("...u950")
-
-    print("v950...")
-    v950 = interpolator2DRho.interp(v950)
-    print("...v950")
-
-    print("tc950...")
-    tc950 = interpolator2DRho.interp(tc950)
-    print("...tc950")
-
-    print("rh950...")
-    rh950 = interpolator2DRho.interp(rh950)
-    print("...rh950")
-
-    print("u925...")
-    u925 = interpolator2DRho.interp(u925)
-    print("...u925")
-
-    print("v925...")
-    v925 = interpolator2DRho.interp(v925)
-    print("...v925")
-
-    print("tc925...")
-    tc925 = interpolator2DRho.interp(tc925)
-    print("...tc925")
-
-    print("rh925...")
-    rh925 = interpolator2DRho.interp(rh925)
-    print("...rh925")
-
-    print("u850...")
-    u850 = interpolator2DRho.interp(u850)
-    print("...u850")
-
-    print("v850...")
-    v850 = interpolator2DRho.interp(v850)
-    print("...v850")
-
-    print("tc850...")
-    tc850 = interpolator2DRho.interp(tc850)
-    print("...tc850")
-
-    print("rh850...")
-    rh850 = interpolator2DRho.interp(rh850)
-    print("...rh850")
-
-    print("u700...")
-    u700 = interpolator2DRho.interp(u700)
-    print("...u700")
-
-    print("v700...")
-    v700 = interpolator2DRho.interp(v700)
-    print("...v700")
-
-    print("tc700...")
-    tc700 = interpolator2DRho.interp(tc700)
-    print("...tc700")
-
-    print("rh700...")
-    rh700 = interpolator2DRho.interp(rh700)
-    print("...rh700")
-
-    print("u500...")
-    u500 = interpolator2DRho.interp(u500)
-    print("...u500")
-
-    print("v500...")
-    v500 = interpolator2DRho.interp(v500)
-    print("...v500")
-
-    print("tc500...")
-    tc500 = interpolator2DRho.interp(tc500)
-    print("...tc500")
-
-    print("rh500...")
-    rh500 = interpolator2DRho.interp(rh500)
-    print("...rh500")
-
-    print("u300...")
-    u300 = interpolator2DRho.interp(u300)
-    print("...u300")
-
-    print("v300...")
-    v300 = interpolator2DRho.interp(v300)
-    print("...v300")
-
-    print("tc300...")
-    tc300 = interpolator2DRho.interp(tc300)
-    print("...tc300")
-
-    print("rh300...")
-    rh300 = interpolator2DRho.interp(rh300)
-    print("...rh300")
+def process(iDate, src, src_1hago, src_00, dst, outputs, cache, state, method, dtype, encoding, region, metrics):
+    print("iDate:" + iDate + " src: " + src + " dst: " + dst)
+    metrics.begin(src)
 
-    print("gph500...")
-    gph500 = interpolator2DRho.interp(gph500)
-    print("...gph500")
+    # Open the NetCDF file
+    with metrics.stage("read"):
+        ncsrcfile = Dataset(src)
 
-    print("gph850...")
-    gph850 = interpolator2DRho.interp(gph850)
-    print("...gph850")
+    datetime_current = get_valid_time(ncsrcfile)
+    datetime_1h_ago = datetime_current - timedelta(hours=1)
+    datetime_00 = datetime(datetime_current.year, datetime_current.month, datetime_current.day, 0, 0, 0)
 
-    print("slp...")
-    slp = interpolator2DRho.interp(slp)
-    print("...slp")
+    time = [ datetime_current ]
+    print("Dates -- current: " + str(datetime_current) + " 1h ago: " + str(datetime_1h_ago) + " today: " + str(datetime_00))
 
-    print("clf...")
-    clf = interpolator2DRho.interp(clf)
-    print("...clf")
+    #src_1hago = history_dir + "/" + get_date_time_path(datetime_1h_ago) + "/" + prod + "_" + domain + "_" + get_date_time(datetime_1h_ago) + ".nc"
+    #src_00 = history_dir + "/" + get_date_time_path(datetime_00) + "/" + prod + "_" + domain + "_" + get_date_time(datetime_00) + ".nc"
 
-    print("u10m...")
-    u10m = interpolator2DRho.interp(uvmet10[0])
-    print("...u10m")
+    print("Prev       : " + str(src_1hago))
+    print("Current day: " + str(src_00))
 
-    print("v10m...")
-    v10m = interpolator2DRho.interp(uvmet10[1])
-    print("...v10m")
+    # Create, or reuse, the 2D biliniear interpolator of the source grid
+    with metrics.stage("geometry"):
+        window, interpolator2DRho = interpolator(ncsrcfile, cache, method, dtype, region)
 
-    print("tt...")
-    tt = interpolator2DRho.interp(tt)
-    print("...tt")
+    # Instantiate a WRF archive file
+    with metrics.stage("write"):
+        wrf = WRF(dst, time, interpolator2DRho.dstLons, interpolator2DRho.dstLats, encoding, outputs)
+
+    # The interpolated fields of each hour are saved for the runs of the next
+    # hours of the same forecast run: the state of a previous run, in a shared
+    # state directory, is never taken for the past hours of this one
+    forecastRun = getattr(ncsrcfile, "SIMULATION_START_DATE", iDate)
+    stateKey = GeometryCache.key("wrf5-" + method + "-" + interpolator2DRho.dtype.name + "-" +
+                                 "".join(c for c in forecastRun if c.isalnum()),
+                                 interpolator2DRho.srcLons, interpolator2DRho.srcLats,
+                                 interpolator2DRho.dstLons, interpolator2DRho.dstLats)
+
+    # The fields are read, and the diagnostics cut, over the window of the
+    # source grid covering the region
+    def read(name):
+        with metrics.stage("read"):
+            return ncsrcfile[name][(Ellipsis,) + window]
+
+    def diagnostic(*args, **kwargs):
+        with metrics.stage("diagnostics"):
+            return getvar(ncsrcfile, *args, **kwargs)[(Ellipsis,) + window]
+
+    def pressureLevels(p, *fields):
+        with metrics.stage("vertical"):
+            return interplevels(np.stack(fields), p, levels)
+
+    def interp(name, field):
+        print(name + "...")
+        with metrics.stage("horizontal"):
+            values = interpolator2DRho.interp(field)
+        print("..." + name)
+        return values
+
+    def pastFields(validTime, src_past, names, label):
+        # The interpolated fields of a past hour: saved by its run, or else
+        # recomputed from its dataset
+        if validTime == datetime_current:
+            return None
+        saved = state.load(stateKey, validTime)
+        if saved is not None and all(name in saved for name in names):
+            print(label + " deltas from the saved state")
+            return saved
+        try:
+            with Dataset(src_past) as ncpast:
+                pastTime = get_valid_time(ncpast)
+            if pastTime != validTime:
+                print("WARNING *** The " + label + " dataset " + src_past + " is valid at " + str(pastTime) +
+                      ", not " + str(validTime) + ": the " + label + " deltas start from " + str(pastTime))
+            print("Calculating " + label + " deltas...")
+            with metrics.stage("diagnostics"):
+                fields = recomputeFields(src_past, names, window, interpolator2DRho)
+            print("...done with " + label + " processing.")
+            return fields
+        except Exception as e:
+            print("WARNING *** Troubles with the " + label + " dataset: " + src_past)
+            print(e)
+            return None
+
+    # The diagnostics, computed only when a requested output needs them
+    graph = Graph()
 
-    print("ki...")
-    ki = interpolator2DRho.interp(ki)
-    print("...ki")
+    # Extract the pressure, geopotential height, temperature
+    graph.add("pressure", lambda: diagnostic("pressure"))
+    graph.add("z", lambda: diagnostic("z", units="dm"))
+    graph.add("tc", lambda: diagnostic("temp", units="degC"))
+    graph.add("td", lambda: diagnostic("td", units="degC"))
+    graph.add("theta_e", lambda: diagnostic("theta_e", units="degC"))
+    graph.add("theta_w", lambda: diagnostic("twb", units="degC"))
+    graph.add("rh", lambda: diagnostic("rh"))
+    graph.add("uvmet", lambda: diagnostic("uvmet"))
+    graph.add("u", lambda uvmet: uvmet[0], "uvmet")
+    graph.add("v", lambda uvmet: uvmet[1], "uvmet")
+    graph.add("cape_2d", lambda: diagnostic("cape_2d", meta=False))
+    graph.add("updraft_helicity", lambda: diagnostic("updraft_helicity", meta=False))
+    graph.add("helicity", lambda: diagnostic("helicity", meta=False))
+    # Get the sea level pressure
+    graph.add("slp", lambda: diagnostic("slp", meta=False))
+    graph.add("rh2", lambda: diagnostic("rh2", meta=False))
+    graph.add("pw", lambda: diagnostic("pw", meta=False))
+    # Cloud fraction as the maximum of the low and mid layers
+    graph.add("cloudfrac", lambda: diagnostic("cloudfrac", meta=False))
+    graph.add("clf", lambda cloudfrac: np.maximum(cloudfrac[0], cloudfrac[1]), "cloudfrac")
+    # Read the temperature at 2m in celsius
+    graph.add("t2c", lambda: read("T2") - 273.15)
+    # Read the snow rate
+    graph.add("sr", lambda: read("SR"))
+    # Get the wind at 10m u and v components (meteo oriented)
+    graph.add("uvmet10", lambda: diagnostic("uvmet10", meta=False))
+    # Get the wind speed and wind dir at 10m (meteo oriented)
+    graph.add("uvmet10_wspd_wdir", lambda: diagnostic("uvmet10_wspd_wdir", meta=False))
+    # Read the simulation cumulated rain from the current file
+    graph.add("rain", lambda: read("RAINC") + read("RAINNC") + read("RAINSH"))
+
+    # The 3D fields on the pressure levels, interpolated in a single pass by
+    # the plevels node (defined below, once the needed fields are known)
+    for field in levelFields:
+        for m, level in enumerate(levels):
+            graph.add(field + str(level), lambda plevels, field=field, m=m: plevels[plevelFields.index(field), m],
+                      "plevels")
+    graph.add("tt", lambda tc850, td850, tc500: tc850 + td850 - 2*tc500, "tc850", "td850", "tc500")
+    graph.add("ki", lambda tc850, tc500, td850, tc700, td700: (tc850-tc500)+td850-(tc700-td700),
+              "tc850", "tc500", "td850", "tc700", "td700")
+    graph.add("delta_theta", lambda theta_e500, theta_e850: theta_e500-theta_e850, "theta_e500", "theta_e850")
+
+    # The output variables, on the destination grid
+    for name, depend in (("PW", "pw"), ("RH2", "rh2"), ("UH", "updraft_helicity"), ("SRH", "helicity"),
+                         ("SLP", "slp"), ("CLDFRA_TOTAL", "clf"), ("TT", "tt"), ("KI", "ki"),
+                         ("THETA_E850", "theta_e850"), ("THETA_W850", "theta_w850"), ("DELTA_THETA", "delta_theta"),
+                         ("GPH500", "z500"), ("GPH850", "z850")):
+        graph.add(name, lambda field, name=name: interp(WRF.fields[name], field), depend)
+    for prefix, field in (("U", "u"), ("V", "v"), ("TC", "tc"), ("RH", "rh")):
+        for level in levels:
+            name = prefix + str(level)
+            graph.add(name, lambda field, name=name: interp(WRF.fields[name], field), field + str(level))
+    for name, depend, index in (("T2C", "t2c", 0), ("MCAPE", "cape_2d", 0), ("MCIN", "cape_2d", 1),
+                                ("U10M", "uvmet10", 0), ("V10M", "uvmet10", 1),
+                                ("WSPD10", "uvmet10_wspd_wdir", 0), ("WDIR10", "uvmet10_wspd_wdir", 1)):
+        graph.add(name, lambda field, name=name, index=index: interp(WRF.fields[name], field[index]), depend)
+
+    # Interpolate the cumulated rain and the snow rate
+    graph.add("raini", lambda rain: interp("rain", rain[0]), "rain")
+    graph.add("sri", lambda sr: interp("sr", sr[0]), "sr")
+
+    # The fields of midnight and of the previous hour; without them, just
+    # calculate from 0
+    graph.add("past_00", lambda: pastFields(datetime_00, src_00, ["rain"], "daily"))
+    graph.add("raini_00", lambda raini, past: raini if past is None else past["rain"], "raini", "past_00")
+    graph.add("past_1hago", lambda: pastFields(datetime_1h_ago, src_1hago, pastNames, "1 hour ago"))
+    graph.add("raini_1hago", lambda raini, past: raini if past is None else past["rain"], "raini", "past_1hago")
+    graph.add("wspd10i_1hago", lambda wspd10i, past: wspd10i if past is None else past["wspd10"],
+              "WSPD10", "past_1hago")
+    graph.add("wdir10i_1hago", lambda wdir10i, past: wdir10i if past is None else past["wdir10"],
+              "WDIR10", "past_1hago")
+
+    # Calculate the daily and the hourly cumulated rain, and the wind shift
+    graph.add("DAILY_RAIN", lambda raini, raini_00: raini - raini_00, "raini", "raini_00")
+    graph.add("DELTA_RAIN", lambda raini, raini_1hago: raini - raini_1hago, "raini", "raini_1hago")
+    graph.add("DELTA_WSPD10", lambda wspd10i, wspd10i_1hago: wspd10i - wspd10i_1hago, "WSPD10", "wspd10i_1hago")
+    graph.add("DELTA_WDIR10", lambda wdir10i, wdir10i_1hago: wdir10i - wdir10i_1hago, "WDIR10", "wdir10i_1hago")
 
-    print("theta_e850...")
-    theta_e850 = interpolator2DRho.interp(theta_e850)
-    print("...theta_e850")
+    # Calc snow water equivalent
+    graph.add("HOURLY_SWE", snowWaterEquivalent, "DELTA_RAIN", "sri")
 
-    print("theta_w850...")
-    theta_w850 = interpolator2DRho.interp(theta_w850)
-    print("...theta_w850")
+    # Interpolate the 3D fields needed by the outputs only, and read only the
+    # past fields they need
+    graph.add("plevels", None)
+    needed = graph.closure(outputs)
+    plevelFields = [field for field in levelFields if any(field + str(level) in needed for level in levels)]
+    graph.add("plevels", pressureLevels, "pressure", *plevelFields)
+    pastNames = [name for name in ("rain", "wspd10", "wdir10") if name + "i_1hago" in needed]
 
-    print("delta_theta...")
-    delta_theta = interpolator2DRho.interp(delta_theta)
-    print("...delta_theta")
-    
     print("Saving archive file...")
-    wrf.dwspd10 = dwspd10i
-    wrf.dwdir10 = dwdir10i
-    wrf.drain = draini
-    wrf.hrain = hraini
-    wrf.hswe = hswei
-    wrf.pw = pw
-    wrf.rh2 = rh2
-    wrf.t2c = t2c
-    wrf.uh = uh
-    wrf.srh = srh
-    wrf.mcape = mcape
-    wrf.mcin = mcin
-    wrf.u1000 = u1000
-    wrf.v1000 = v1000
-    wrf.tc1000 = tc1000
-    wrf.rh1000 = rh1000
-    wrf.u975 = u975
-    wrf.v975 = v975
-    wrf.tc975 = tc975
-    wrf.rh975 = rh975
-    wrf.u950 = u950
-    wrf.v950 = v950
-    wrf.tc950 = tc950
-    wrf.rh950 = rh950
-    wrf.u925 = u925
-    wrf.v925 = v925
-    wrf.tc925 = tc925
-    wrf.rh925 = rh925
-    wrf.u850 = u850
-    wrf.v850 = v850
-    wrf.tc850 = tc850
-    wrf.rh850 = rh850
-    wrf.u700 = u700
-    wrf.v700 = v700
-    wrf.tc700 = tc700
-    wrf.rh700 = rh700
-    wrf.u500 = u500
-    wrf.v500 = v500
-    wrf.tc500 = tc500
-    wrf.rh500 = rh500
-    wrf.u300 = u300
-    wrf.v300 = v300
-    wrf.tc300 = tc300
-    wrf.rh300 = rh300
-    wrf.tt = tt
-    wrf.ki = ki
-    wrf.theta_e850 = theta_e850
-    wrf.theta_w850 = theta_w850
-    wrf.delta_theta = delta_theta
-    wrf.gph500 = gph500
-    wrf.gph850 = gph850
-    wrf.slp = slp
-    wrf.clf = clf
-    wrf.u10m = u10m
-    wrf.v10m = v10m
-    wrf.wspd10 = wspd10i
-    wrf.wdir10 = wdir10i
-
-    wrf.write()
+    for name, values in graph.compute(outputs, keep=["raini", "WSPD10", "WDIR10"]):
+        with metrics.stage("write"):
+            wrf.writeVariable(name, values)
+
+    saved = {}
+    for name, node in (("rain", "raini"), ("wspd10", "WSPD10"), ("wdir10", "WDIR10")):
+        if node in graph.values:
+            saved[name] = graph.values[node]
+    if saved:
+        with metrics.stage("write"):
+            state.save(stateKey, datetime_current, saved, keep=[datetime_00])
 
     # Close the NetCDF file
     ncsrcfile.close()
-    wrf.close()
\ No newline at end of file
+    with metrics.stage("write"):
+        wrf.close()
+    metrics.end()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("initialization_date")
+    parser.add_argument("source_file", nargs="+",
+                        help="source files or glob patterns; with several, destination_file is a directory")
+    parser.add_argument("source_file_1hago")
+    parser.add_argument("source_file_00")
+    parser.add_argument("destination_file")
+    parser.add_argument("--variables", nargs="+", choices=list(products) + list(WRF.attributes), metavar="NAME",
+                        help="output variables or groups of them (" + ", ".join(products) + "); default: all")
+    parser.add_argument("--method", choices=["nearest", "bilinear", "idw"], default="nearest",
+                        help="horizontal interpolation method (default: nearest)")
+    parser.add_argument("--float32", action="store_true",
+                        help="interpolate in single precision, as the fields are stored")
+    GeometryCache.addArguments(parser)
+    State.addArguments(parser)
+    Encoding.addArguments(parser)
+    Region.addArguments(parser)
+    Profiler.addArguments(parser)
+    Metrics.addArguments(parser)
+    args = parser.parse_args()
+    Profiler.fromArguments(args).start()
+
+    iDate = args.initialization_date
+    method = args.method
+    dtype = np.float32 if args.float32 else np.float64
+    cache = GeometryCache.fromArguments(args)
+    state = State.fromArguments(args)
+    encoding = Encoding.fromArguments(args)
+    region = Region.fromArguments(args)
+    metrics = Metrics.fromArguments(args, "wrf5")
+
+    # The selected output variables, in file order
+    selected = set()
+    for name in args.variables or WRF.attributes:
+        selected.update(products.get(name, [name]))
+    outputs = [name for name in WRF.attributes if name in selected]
+
+    batch = Batch(args.source_file, args.destination_file)
+
+    # Within a batch the previous hour and midnight files are the sources with
+    # those valid times, otherwise the ones given on the command line
+    sources = {}
+    validTimes = {}
+    for src in batch.sources:
+        ncsrcfile = Dataset(src)
+        validTimes[src] = get_valid_time(ncsrcfile)
+        sources[validTimes[src]] = src
+        ncsrcfile.close()
+
+    # The interpolator is built for the first file and reused for the others
+    for src, dst in batch:
+        datetime_current = validTimes[src]
+        datetime_00 = datetime(datetime_current.year, datetime_current.month, datetime_current.day, 0, 0, 0)
+        src_1hago = sources.get(datetime_current - timedelta(hours=1), args.source_file_1hago)
+        src_00 = sources.get(datetime_00, args.source_file_00)
+        process(iDate, src, src_1hago, src_00, dst, outputs, cache, state, method, dtype, encoding, region, metrics)
@@ -1,81 +1,105 @@
-import sys
+import argparse
 import numpy as np
 from netCDF4 import Dataset
+from util.Profiler import Profiler
 from util.WW33 import WW33
+from util.Batch import Batch
+from util.Encoding import Encoding
+from util.GeometryCache import GeometryCache
+from util.Metrics import Metrics
 from util.Interpolator import Interp2D
+from util.Region import Region
 
 
-if __name__ == '__main__':
-    if len(sys.argv) != 5:
-        print("Usage: python " + str(sys.argv[0]) + " initialization_date source_file history_dir destination_file")
-        sys.exit(-1)
+# Interpolators by source grid, reused across the files of a batch
+interpolators = {}
 
-    iDate = sys.argv[1]
-    src = sys.argv[2]
-    history_dir = sys.argv[3]
-    dst = sys.argv[4]
 
+def interpolator(ncsrcfile, cache, method, dtype, region):
+    srcLats = ncsrcfile["latitude"][:]
+    srcLons = ncsrcfile["longitude"][:]
+
+    key = GeometryCache.key("ww33", srcLons, srcLats)
+    if key not in interpolators:
+        Xlon, Xlat = np.meshgrid(srcLons, srcLats)
+        dLon = (srcLons[1]-srcLons[0])*.75
+        dLat = (srcLats[1]-srcLats[0])*.75
+        dstLat =  np.arange(Xlat.min(), Xlat.max(), dLat)
+        dstLon =  np.arange(Xlon.min(), Xlon.max(), dLon)
+        # The region of interest, from the window of the source grid covering it
+        dstLon, dstLat = region.axes(dstLon, dstLat)
+        window = region.window(Xlon, Xlat, dstLon, dstLat)
+        interpolators[key] = (window, Interp2D(Xlon[window], Xlat[window], dstLon, dstLat, cache, method, dtype))
+    return interpolators[key]
+
+
+def process(iDate, src, history_dir, dst, cache, method, dtype, encoding, region, metrics):
     print("iDate:" + iDate + " src: " + src + " history: " + history_dir + " dst: " + dst)
+    metrics.begin(src)
 
     # Open the NetCDF file
-    ncsrcfile = Dataset(src)
+    with metrics.stage("read"):
+        ncsrcfile = Dataset(src)
 
-    # Read variables
-    time = ncsrcfile.variables["time"][:]
-    srcLats = ncsrcfile["latitude"][:]
-    srcLons = ncsrcfile["longitude"][:]
+        # Read variables
+        time = ncsrcfile.variables["time"][:]
 
-    Xlon, Xlat = np.meshgrid(srcLons, srcLats)
-    dLon = (srcLons[1]-srcLons[0])*.75
-    dLat = (srcLats[1]-srcLats[0])*.75
-    dstLat =  np.arange(Xlat.min(), Xlat.max(), dLat)
-    dstLon =  np.arange(Xlon.min(), Xlon.max(), dLon)
+    # Create, or reuse, the 2D biliniear interpolator of the source grid
+    with metrics.stage("geometry"):
+        window, interpolator2D = interpolator(ncsrcfile, cache, method, dtype, region)
 
     # Instantiate a WW33 archive file
-    ww33 = WW33(dst, time, dstLon, dstLat)
-
-    # Create a 2D biliniear interpolator on Rho points
-    interpolator2D = Interp2D(Xlon, Xlat, dstLon, dstLat)
-
-    print("dpt...")
-    dpt = ncsrcfile.variables["dpt"][:]
-    dpt = interpolator2D.interp(dpt)
-    print("...dpt")
-
-    print("hs...")
-    hs = ncsrcfile.variables["hs"][:]
-    hs = interpolator2D.interp(hs)
-    print("...hs")
-
-    print("lm...")
-    lm = ncsrcfile.variables["lm"][:]
-    lm = interpolator2D.interp(lm)
-    print("...lm")
-
-    print("fp...")
-    fp = ncsrcfile.variables["fp"][:]
-    fp = interpolator2D.interp(fp)
-    print("...fp")
-
-    print("dir...")
-    dir = ncsrcfile.variables["dir"][:]
-    dir = interpolator2D.interp(dir)
-    print("...dir")
-
-    print("t0m1...")
-    t0m1 = ncsrcfile.variables["t0m1"][:]
-    t0m1 = interpolator2D.interp(t0m1)
-    print("...t0m1")
-
-    print("Saving archive file...")
-    ww33.dpt = dpt
-    ww33.hs = hs
-    ww33.lm = lm
-    ww33.fp = fp
-    ww33.dir = dir
-    ww33.period = t0m1
-    ww33.write()
+    with metrics.stage("write"):
+        ww33 = WW33(dst, time, interpolator2D.dstLons, interpolator2D.dstLats, encoding)
+
+    # Source variable -> archive variable
+    for name, output in (("dpt", "dpt"), ("hs", "hs"), ("lm", "lm"), ("fp", "fp"), ("dir", "dir"),
+                         ("t0m1", "period")):
+        print(name + "...")
+        with metrics.stage("read"):
+            invar = ncsrcfile.variables[name][(Ellipsis,) + window]
+        with metrics.stage("horizontal"):
+            outvar = interpolator2D.interp(invar)
+        with metrics.stage("write"):
+            ww33.writeVariable(output, outvar)
+        del invar, outvar
+        print("..." + name)
 
     # Close the NetCDF file
     ncsrcfile.close()
-    ww33.close()
\ No newline at end of file
+    with metrics.stage("write"):
+        ww33.close()
+    metrics.end()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("initialization_date")
+    parser.add_argument("source_file", nargs="+",
+                        help="source files or glob patterns; with several, destination_file is a directory")
+    parser.add_argument("history_dir")
+    parser.add_argument("destination_file")
+    parser.add_argument("--method", choices=["nearest", "bilinear", "idw"], default="nearest",
+                        help="horizontal interpolation method (default: nearest)")
+    parser.add_argument("--float32", action="store_true",
+                        help="interpolate in single precision, as the fields are stored")
+    GeometryCache.addArguments(parser)
+    Encoding.addArguments(parser)
+    Region.addArguments(parser)
+    Profiler.addArguments(parser)
+    Metrics.addArguments(parser)
+    args = parser.parse_args()
+    Profiler.fromArguments(args).start()
+
+    iDate = args.initialization_date
+    history_dir = args.history_dir
+    method = args.method
+    dtype = np.float32 if args.float32 else np.float64
+    cache = GeometryCache.fromArguments(args)
+    encoding = Encoding.fromArguments(args)
+    region = Region.fromArguments(args)
+    metrics = Metrics.fromArguments(args, "ww33")
+
+    # The interpolators are built for the first file and reused for the others
+    for src, dst in Batch(args.source_file, args.destination_file):
+        process(iDate, src, history_dir, dst, cache, method, dtype, encoding, region, metrics)
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class Archive:
+    # NetCDF variable name -> attribute holding its values, set by the subclasses
+    fields = {}
+
+    ncdstfile = None
+    encoding = None
+
+    def createVariable(self, name, dimensions, fill_value=1.e+37):
+        sizes = {dimension: len(self.ncdstfile.dimensions[dimension]) for dimension in dimensions}
+        options = self.encoding.options(name, dimensions, sizes)
+        return self.ncdstfile.createVariable(name, "f4", dimensions, fill_value=fill_value, **options)
+
+    def writeVariable(self, name, values, start=0, depth=None, region=None):
+        # Write the values of a single variable at record offset start and,
+        # for depth variables, at a single depth level or slab; with a region,
+        # (latitude, longitude) slices, into that hyperslab of the grid
+        variable = self.ncdstfile.variables[name]
+        region = () if region is None else (Ellipsis,) + tuple(region)
+        if "time" not in variable.dimensions:
+            variable[region or slice(None)] = values
+            return
+
+        values = np.asanyarray(values)
+        ndim = variable.ndim if depth is None or isinstance(depth, slice) else variable.ndim - 1
+        if values.ndim < ndim:
+            # A single record without its time axis
+            values = values[None]
+
+        records = slice(start, start + len(values))
+        if depth is None:
+            variable[(records,) + region] = values
+        else:
+            variable[(records, depth) + region] = values
+
+    def write(self, start=0):
+        # Write the held fields at record offset start, then release them
+        for name, attr in self.fields.items():
+            values = getattr(self, attr)
+            if values is not None:
+                self.writeVariable(name, values, start)
+                setattr(self, attr, None)
+
+    def close(self):
+        if self.ncdstfile:
+            self.ncdstfile.close()
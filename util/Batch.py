@@ -0,0 +1,36 @@
+import os
+import glob
+
+
+class Batch:
+    """
+    Source files processed in one run, and the destination file of each.
+
+    The sources are file names or glob patterns, expanded in sorted order. A
+    single source is written to the destination file as given; with several
+    sources the destination is a directory and each output is named after its
+    source file.
+    """
+
+    def __init__(self, patterns, destination):
+        self.sources = []
+        for pattern in patterns:
+            if glob.has_magic(pattern):
+                matches = sorted(glob.glob(pattern))
+                if not matches:
+                    raise ValueError("No source file matches: " + pattern)
+                self.sources.extend(matches)
+            else:
+                self.sources.append(pattern)
+
+        if len(self.sources) == 1 and not os.path.isdir(destination):
+            self.destinations = [destination]
+        else:
+            os.makedirs(destination, exist_ok=True)
+            self.destinations = [os.path.join(destination, os.path.basename(src)) for src in self.sources]
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        return iter(zip(self.sources, self.destinations))
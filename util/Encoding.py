@@ -0,0 +1,117 @@
+import json
+import netCDF4
+
+
+compressors = {
+    "none": True,
+    "zlib": True,
+    "szip": netCDF4.__has_szip_support__,
+    "bzip2": netCDF4.__has_bzip2_support__,
+    "zstd": netCDF4.__has_zstandard_support__,
+    "blosc_lz": netCDF4.__has_blosc_support__,
+    "blosc_lz4": netCDF4.__has_blosc_support__,
+    "blosc_lz4hc": netCDF4.__has_blosc_support__,
+    "blosc_zlib": netCDF4.__has_blosc_support__,
+    "blosc_zstd": netCDF4.__has_blosc_support__,
+}
+
+
+def supported(compression):
+    if compression in ("none", "zlib"):
+        return True
+    if not compressors.get(compression):
+        return False
+    # The netCDF library may support a filter whose HDF5 plugin is not installed
+    try:
+        with netCDF4.Dataset("probe.nc", "w", diskless=True, persist=False) as probe:
+            probe.createDimension("x", 1)
+            probe.createVariable("x", "f4", ("x",), compression=compression)
+    except RuntimeError:
+        return False
+    return True
+
+
+class Encoding:
+    """
+    Compression and chunking of the output variables.
+
+    The defaults apply to every variable and can be overridden per variable
+    (by NetCDF variable name) with the keys compression, complevel, shuffle
+    and chunksizes. With chunking "level" a chunk holds one record of a single
+    depth level, which suits per-depth map reads; with "time" it holds a whole
+    record. With a tile size (the tiled mode of the 3D products) the chunks
+    span tile x tile points, so that each tile writes whole chunks.
+
+    A JSON configuration file has the same layout, e.g.:
+
+        {"compression": "zstd", "complevel": 3,
+         "variables": {"temp": {"chunksizes": [1, 1, 256, 256]}}}
+    """
+
+    def __init__(self, compression="zlib", complevel=4, shuffle=True, chunking="level", variables=None,
+                 tile=None):
+        self.compression = compression
+        self.complevel = complevel
+        self.shuffle = shuffle
+        self.chunking = chunking
+        self.variables = variables or {}
+        self.tile = tile
+
+        for settings in [self.__dict__] + list(self.variables.values()):
+            compression = settings.get("compression", "zlib")
+            if compression not in compressors:
+                raise ValueError("Unknown compression: " + str(compression))
+            if not supported(compression):
+                raise ValueError("Compression not available in the installed netCDF/HDF5 libraries: " + compression)
+        if chunking not in ("level", "time"):
+            raise ValueError("Unknown chunking: " + str(chunking))
+
+    @staticmethod
+    def addArguments(parser):
+        parser.add_argument("--encoding", metavar="CONFIG",
+                            help="JSON file with the compression and chunking of the output variables")
+        parser.add_argument("--compression", choices=list(compressors),
+                            help="compressor of the output variables (default: zlib)")
+        parser.add_argument("--complevel", type=int, help="compression level (default: 4)")
+        parser.add_argument("--no-shuffle", dest="shuffle", action="store_false", default=None,
+                            help="disable the shuffle filter")
+        parser.add_argument("--chunking", choices=["level", "time"],
+                            help="chunk per depth level or per whole record (default: level)")
+
+    @staticmethod
+    def fromArguments(args):
+        settings = {}
+        if args.encoding:
+            with open(args.encoding) as f:
+                settings = json.load(f)
+        # Command line options win over the configuration file
+        for name in ("compression", "complevel", "shuffle", "chunking"):
+            if getattr(args, name) is not None:
+                settings[name] = getattr(args, name)
+        return Encoding(**settings)
+
+    def options(self, name, dimensions, sizes):
+        settings = {"compression": self.compression, "complevel": self.complevel, "shuffle": self.shuffle}
+        settings.update(self.variables.get(name, {}))
+
+        chunksizes = settings.get("chunksizes")
+        if chunksizes is None:
+            chunksizes = []
+            for dimension in dimensions:
+                if dimension == "time" or (dimension == "depth" and self.chunking == "level"):
+                    chunksizes.append(1)
+                elif dimension in ("latitude", "longitude") and self.tile:
+                    chunksizes.append(max(min(sizes[dimension], self.tile), 1))
+                else:
+                    chunksizes.append(max(sizes[dimension], 1))
+
+        options = {"chunksizes": chunksizes}
+        compression = settings["compression"]
+        if compression != "none":
+            options["compression"] = compression
+            options["complevel"] = settings["complevel"]
+            if compression.startswith("blosc"):
+                options["blosc_shuffle"] = 1 if settings["shuffle"] else 0
+            else:
+                options["shuffle"] = settings["shuffle"]
+        return options
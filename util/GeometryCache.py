@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+
+class GeometryCache:
+    """
+    Directory of memory-mappable interpolation geometry bundles.
+
+    Each bundle is a sub directory named after a fingerprint of the grids it
+    was computed from and holds one .npy file per array, listed in its
+    manifest. Bundles are written into a temporary directory and renamed into
+    place, so concurrent jobs never see a partial bundle, and a bundle missing
+    any of its arrays (being evicted by a concurrent job) is a cache miss. When
+    the cache grows over max_bytes the least recently used bundles are evicted.
+    """
+
+    def __init__(self, path, max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def addArguments(parser):
+        parser.add_argument("--cache-dir", default=os.environ.get("POSTPRO_CACHE_DIR"),
+                            help="interpolation geometry cache directory (default: $POSTPRO_CACHE_DIR)")
+        parser.add_argument("--cache-size", type=float, default=2.0,
+                            help="maximum size of the geometry cache in GB (default: 2)")
+
+    @staticmethod
+    def fromArguments(args):
+        if not args.cache_dir:
+            return None
+        return GeometryCache(args.cache_dir, int(args.cache_size * 1024 ** 3))
+
+    @staticmethod
+    def key(name, *arrays):
+        digest = hashlib.sha1(name.encode())
+        for array in arrays:
+            array = np.ascontiguousarray(np.ma.getdata(array))
+            digest.update(str(array.dtype).encode())
+            digest.update(str(array.shape).encode())
+            digest.update(array.tobytes())
+        return name + "-" + digest.hexdigest()
+
+    def load(self, key):
+        bundle = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(bundle, "manifest.json")) as f:
+                names = json.load(f)
+            arrays = {}
+            for name in names:
+                arrays[name] = np.asarray(np.load(os.path.join(bundle, name + ".npy"), mmap_mode="r"))
+            # Mark the bundle as recently used
+            os.utime(bundle)
+        except (OSError, ValueError):
+            # Missing, evicted by a concurrent job while loading, or truncated
+            return None
+        return arrays
+
+    def save(self, key, arrays):
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+        bundle = os.path.join(self.path, key)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, name + ".npy"), np.asarray(array))
+            with open(os.path.join(tmp, "manifest.json"), "w") as f:
+                json.dump(list(arrays), f)
+            if os.path.isdir(bundle) and not os.path.exists(os.path.join(bundle, "manifest.json")):
+                # A bundle without a manifest, left by an earlier version or
+                # by an eviction: replace it
+                shutil.rmtree(bundle, ignore_errors=True)
+            os.rename(tmp, bundle)
+        except OSError:
+            # Another job stored the same bundle first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def fetch(self, key, compute):
+        arrays = self.load(key)
+        if arrays is None:
+            arrays = compute()
+            self.save(key, arrays)
+        return arrays
+
+    def evict(self):
+        bundles = []
+        total = 0
+        for entry in os.scandir(self.path):
+            try:
+                if entry.name.startswith(".tmp-"):
+                    # Leftovers of jobs killed while saving
+                    if time.time() - entry.stat().st_mtime > 3600:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                bundles.append((entry.stat().st_mtime, size, entry.path))
+                total += size
+            except OSError:
+                continue
+
+        for mtime, size, path in sorted(bundles):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,62 @@
+from collections import Counter
+
+
+class Graph:
+    """
+    Named values computed on demand from the values they depend on.
+
+    Each node is a function of the values of its dependencies, which are
+    computed first. Only the nodes the requested names depend on are computed,
+    each once, and intermediate values are released after their last use.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.values = {}
+        self.consumers = Counter()
+        self.keep = set()
+
+    def add(self, name, function, *depends):
+        self.nodes[name] = (function, depends)
+
+    def closure(self, names):
+        # The names and everything they depend on
+        needed = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.nodes[name][1])
+        return needed
+
+    def compute(self, names, keep=()):
+        """
+        Yield (name, value) for each requested name, in order.
+
+        The values of the names in keep stay available in self.values once
+        computed, the other intermediate values are released after their last use.
+        """
+        self.keep = set(keep)
+        self.consumers = Counter()
+        for name in self.closure(names):
+            self.consumers.update(self.nodes[name][1])
+        # The caller consumes the requested values
+        self.consumers.update(names)
+
+        for name in names:
+            yield name, self[name]
+            self.release(name)
+
+    def release(self, name):
+        self.consumers[name] -= 1
+        if self.consumers[name] <= 0 and name not in self.keep:
+            self.values.pop(name, None)
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            function, depends = self.nodes[name]
+            self.values[name] = function(*[self[depend] for depend in depends])
+            for depend in depends:
+                self.release(depend)
+        return self.values[name]
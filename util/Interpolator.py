@@ -1,6 +1,8 @@
+import os
 import numpy as np
-from numba import jit
-from scipy.interpolate import griddata
+from numba import config, jit, prange, types
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
 
 
 depths = [3.1657474, 5.4649634, 7.9203773, 10.536604, 13.318384, 16.270586, 19.39821, 22.706392, 26.2004, 29.885643,
@@ -18,97 +20,467 @@ depths = [3.1657474, 5.4649634, 7.9203773, 10.536604, 13.318384, 16.270586, 19.3
           3884.0596, 3972.516, 4062.1304, 4152.896, 4244.804, 4337.8477, 4432.0176, 4527.304, 4623.6987, 4721.1914,
           4819.771, 4919.4272, 5020.1494, 5121.926, 5224.7446, 5328.5938]
 
+# The depth levels as an array, for the kernels
+levels = np.array(depths)
 
-@jit(nopython=True)
-def vertical_interp(s_rho, variable, depths, mask_indices, H):
-    t, k, j, i = variable.shape
-    dst = np.full((t, len(depths), j, i), 1e37)
+# Loading the parallel kernel starts the numba threads, before the worker pools
+# are forked: unlike tbb (the parent hangs at exit) and GNU OpenMP (aborts), the
+# workqueue threading layer survives the fork
+if "NUMBA_THREADING_LAYER" not in os.environ:
+    config.THREADING_LAYER = "workqueue"
 
-    for i, j in zip(*mask_indices):
-        vertical_profile = variable[0, :, i, j][::-1]
-        z_levels = H[i, j] * -s_rho[::-1]
+# The kernels are compiled for the double and single precision paths when the
+# module is imported, and cached on disk (next to this file, or in
+# $NUMBA_CACHE_DIR) so that later runs only load the machine code. Their array
+# arguments are typed read-only, which the writable arrays convert to, so that
+# the memory-mapped arrays of the geometry cache are accepted as well
+precisions = (types.float64, types.float32)
 
-        idx = (np.abs(np.array(depths) - z_levels[-1])).argmin()
-        target_z_levels = depths[:idx + 1]
-        target_z_levels = target_z_levels
 
-        vertical_profile_interp = np.interp(target_z_levels, z_levels, vertical_profile)
-        result = np.full(len(depths), np.nan)
-        result[:len(vertical_profile_interp)] = vertical_profile_interp
-        dst[0, :, i, j] = result
+def readonly(dtype, ndim):
+    return types.Array(dtype, ndim, "C", readonly=True)
+
+
+mask_indices_type = types.UniTuple(readonly(types.int64, 1), 2)
+bottom_levels_signatures = [(readonly(f, 1), readonly(types.float64, 1), mask_indices_type, readonly(f, 2))
+                            for f in precisions]
+vertical_weights_signatures = [(readonly(f, 1), readonly(types.float64, 1), mask_indices_type, readonly(f, 2),
+                                readonly(types.int64, 1)) for f in precisions]
+vertical_interp_signatures = [(readonly(f, 4), mask_indices_type, readonly(types.int64, 1), readonly(types.int32, 1),
+                               readonly(types.float64, 1), types.int64, f, f) for f in precisions]
+depth_integrals_signatures = [(readonly(f, 4), readonly(types.int64, 1), mask_indices_type, f) for f in precisions]
+vertical_levels_interp_signatures = [(readonly(f, 4), readonly(f, 3), readonly(types.float64, 1), types.float64)
+                                     for f in precisions]
+
+
+@jit(bottom_levels_signatures, nopython=True, parallel=True, cache=True)
+def bottom_levels(s_rho, depths, mask_indices, H):
+    nz = len(depths)
+    rows, cols = mask_indices
+    bottom = np.empty(len(rows), np.int64)
+
+    # The depth level nearest to the bottom -h * s_rho[0] of each water column
+    for c in prange(len(rows)):
+        z = H[rows[c], cols[c]] * -s_rho[0]
+        idx = 0
+        for m in range(1, nz):
+            if abs(depths[m] - z) < abs(depths[idx] - z):
+                idx = m
+        bottom[c] = idx
+
+    return bottom
+
+
+@jit(vertical_weights_signatures, nopython=True, parallel=True, cache=True)
+def vertical_weights(s_rho, depths, mask_indices, H, offsets):
+    k = len(s_rho)
+    rows, cols = mask_indices
+    lower = np.empty(offsets[-1], np.int32)
+    weights = np.empty(offsets[-1], np.float64)
+
+    # For the depth levels of each water column, down to its bottom, the
+    # sigma level below and the weight of the one above it (lower - 1), as
+    # np.interp: z ascends with the reversed sigma levels, from the top
+    # -h * s_rho[k - 1] to the bottom -h * s_rho[0], and the depths outside
+    # take the nearest end. A zero weight reads the lower level only.
+    for c in prange(len(rows)):
+        h = H[rows[c], cols[c]]
+        top = h * -s_rho[k - 1]
+        bottom = h * -s_rho[0]
+        m = 0
+        for e in range(offsets[c], offsets[c + 1]):
+            x = depths[e - offsets[c]]
+            weights[e] = 0.0
+            if x > bottom:
+                lower[e] = 0
+            elif x < top:
+                lower[e] = k - 1
+            else:
+                # Merge the ascending target depths with the ascending z levels
+                while m < k - 1 and h * -s_rho[k - 2 - m] <= x:
+                    m += 1
+                z0 = h * -s_rho[k - 1 - m]
+                lower[e] = k - 1 - m
+                if m < k - 1 and z0 != x:
+                    z1 = h * -s_rho[k - 2 - m]
+                    weights[e] = (x - z0) / (np.float64(z1) - np.float64(z0))
+
+    return lower, weights
+
+
+@jit(vertical_interp_signatures, nopython=True, parallel=True, cache=True)
+def vertical_interp(variable, mask_indices, offsets, lower, weights, nz, factor, fill_value):
+    t, k, ny, nx = variable.shape
+    dst = np.full((t, nz, ny, nx), fill_value, variable.dtype)
+    surface = np.full((t, ny, nx), fill_value, variable.dtype)
+    bottom_values = np.full((t, ny, nx), fill_value, variable.dtype)
+    rows, cols = mask_indices
+
+    # The water columns are independent: interpolate them in parallel, each
+    # depth level a weighted sum of two sigma levels, and take the surface and
+    # bottom values of each column on the way; land, the levels below the
+    # bottom and the invalid values stay at the fill value
+    for c in prange(len(rows)):
+        i = rows[c]
+        j = cols[c]
+        for n in range(t):
+            deepest = -1
+            for e in range(offsets[c], offsets[c + 1]):
+                d = e - offsets[c]
+                f0 = np.float64(variable[n, lower[e], i, j])
+                w = weights[e]
+                if w == 0.0:
+                    value = f0
+                else:
+                    value = f0 + w * (np.float64(variable[n, lower[e] - 1, i, j]) - f0)
+                if not np.isnan(value):
+                    dst[n, d, i, j] = value
+                    if dst[n, d, i, j] != fill_value:
+                        deepest = d
+
+            if dst[n, 0, i, j] != fill_value:
+                surface[n, i, j] = dst[n, 0, i, j] * factor
+            if deepest >= 0:
+                bottom_values[n, i, j] = dst[n, deepest, i, j]
+
+    return dst, surface, bottom_values
+
+
+@jit(depth_integrals_signatures, nopython=True, parallel=True, cache=True)
+def depth_integrals(variable, counts, mask_indices, fill_value):
+    t, k, ny, nx = variable.shape
+    nl = len(counts)
+    dst = np.full((nl, t, ny, nx), fill_value, variable.dtype)
+    rows, cols = mask_indices
+    top = 0
+    for l in range(nl):
+        top = max(top, counts[l])
+
+    # Walk each water column once from the surface, down to the deepest limit
+    # only, and take the running sum of the valid values as each limit is
+    # reached: the integral down to limit l covers the top counts[l] levels
+    for c in prange(len(rows)):
+        i = rows[c]
+        j = cols[c]
+        for n in range(t):
+            acc = variable.dtype.type(0)
+            for l in range(nl):
+                if counts[l] == 0:
+                    dst[l, n, i, j] = acc
+            for d in range(top):
+                value = variable[n, d, i, j]
+                if value != fill_value:
+                    acc += value
+                for l in range(nl):
+                    if counts[l] == d + 1:
+                        dst[l, n, i, j] = acc
+
+    return dst
+
+
+def depthIntegrals(variable, limits, mask_indices, depths=depths, fill_value=1.e+37):
+    """
+    Sum a z level field from the surface down to each of several depths.
+
+    The integral down to a limit covers the depth levels not deeper than it,
+    skipping the fill values. Each water column is walked once for all the
+    limits, touching the levels above the deepest one only; land is
+    fill_value.
+
+    Returns:
+        np.ndarray: (limit, time, y, x) stack, in the precision of the field.
+    """
+    counts = np.searchsorted(np.asarray(depths), np.asarray(limits, dtype=np.float64), side="right")
+    return depth_integrals(variable, counts.astype(np.int64), mask_indices, variable.dtype.type(fill_value))
+
+
+@jit(vertical_levels_interp_signatures, nopython=True, parallel=True, cache=True)
+def vertical_levels_interp(fields, vert, levels, missing_value):
+    f, k, ny, nx = fields.shape
+    nl = len(levels)
+    dst = np.empty((f, nl, ny, nx), fields.dtype)
+
+    # As wrf.interplevel: the direction of the vertical coordinate is taken
+    # from the first column, and each level is searched from the model top
+    # for the first strictly bracketing pair of model levels
+    decreasing = vert[0, 0, 0] > vert[k - 1, 0, 0]
+
+    for c in prange(ny * nx):
+        j = c // nx
+        i = c % nx
+        for m in range(nl):
+            level = levels[m]
+            below = -1
+            for kp in range(k - 1, 0, -1):
+                if decreasing:
+                    lo, hi = kp, kp - 1
+                else:
+                    lo, hi = kp - 1, kp
+                if vert[lo, j, i] < level and vert[hi, j, i] > level:
+                    below = lo
+                    above = hi
+                    break
+
+            if below < 0:
+                for n in range(f):
+                    dst[n, m, j, i] = missing_value
+                continue
+
+            # The weights of the column and level, shared by all the fields
+            w2 = (level - np.float64(vert[below, j, i])) / (np.float64(vert[above, j, i]) - np.float64(vert[below, j, i]))
+            w1 = 1.0 - w2
+            for n in range(f):
+                dst[n, m, j, i] = w1 * np.float64(fields[n, below, j, i]) + w2 * np.float64(fields[n, above, j, i])
 
     return dst
 
 
-@jit(nopython=True)
-def extract_value_at_bottom(invar3d, invalid_value=1e37):
-    t, k, lon, lat = invar3d.shape
-    output2D = np.full((t, lon, lat), invalid_value)
+def interplevels(fields, vert, levels, missing_value=np.nan):
+    """
+    Interpolate a stack of 3D fields on several levels of a vertical coordinate.
+
+    The bracketing model levels and the weights of each column are found once
+    and applied to all the fields, with the results of wrf.interplevel. Levels
+    outside a column are missing_value: NaN, as the masked values of
+    wrf.interplevel, so that the horizontal interpolation fills them.
+
+    Returns:
+        np.ndarray: (field, level, y, x) stack, in the precision of the fields.
+    """
+    fields = np.ascontiguousarray(fields)
+    if fields.dtype != np.float32:
+        fields = fields.astype(np.float64)
+    vert = np.ascontiguousarray(vert, dtype=fields.dtype)
+    levels = np.asarray(levels, dtype=np.float64).reshape(-1)
+    return vertical_levels_interp(fields, vert, levels, float(missing_value))
 
-    for i in range(lat):
-        for j in range(lon):            
-            vertical_profile = invar3d[0, :, j, i]
-            valid_values = vertical_profile[vertical_profile != invalid_value]
-        
-            if len(valid_values) > 0:
-                output2D[0, j, i] = valid_values[-1]
-    
-    return output2D
 
+def bilinear_weights(srcLons, srcLats, px, py, nearest, eps=1e-6):
+    """
+    Bilinear weights of the destination points (px, py) on a curvilinear source grid.
 
-@jit(nopython=True)
-def extract_value_at_surface(invar3d, factor=1.0, invalid_value=1e37):
-    t, k, lon, lat = invar3d.shape
-    output2D = np.full((lon, lat), invalid_value)
+    For each point the cells sharing its nearest source node are searched for the
+    one containing it, and the local cell coordinates (s, t) are found inverting
+    the bilinear mapping with a few Newton iterations. Points outside the source
+    grid fall back to their nearest source node.
 
-    for i in range(lat):
-        for j in range(lon):
-            val = invar3d[0, 0, j, i]
-            if val != invalid_value:
-                output2D[j, i] = val * factor
-    
-    return output2D
+    Returns:
+        tuple: (rows, cols, weights) triplets of the sparse weight matrix.
+    """
+    lon = np.asarray(srcLons, dtype=np.float64)
+    lat = np.asarray(srcLats, dtype=np.float64)
+    ny, nx = lon.shape
+    jn, iN = np.divmod(nearest, nx)
+    done = np.zeros(len(px), dtype=bool)
+    rows, cols, weights = [], [], []
+
+    for dj in (-1, 0):
+        for di in (-1, 0):
+            j0 = np.clip(jn + dj, 0, ny - 2)
+            i0 = np.clip(iN + di, 0, nx - 2)
+            corners = [(j0, i0), (j0, i0 + 1), (j0 + 1, i0), (j0 + 1, i0 + 1)]
+            (x00, y00), (x01, y01), (x10, y10), (x11, y11) = [(lon[c], lat[c]) for c in corners]
+
+            # P(s, t) = a + b s + c t + d s t
+            bx, by = x01 - x00, y01 - y00
+            cx, cy = x10 - x00, y10 - y00
+            dx, dy = x11 - x01 - x10 + x00, y11 - y01 - y10 + y00
+            s = np.full(len(px), 0.5)
+            t = np.full(len(px), 0.5)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for _ in range(10):
+                    fx = x00 + bx * s + cx * t + dx * s * t - px
+                    fy = y00 + by * s + cy * t + dy * s * t - py
+                    jxs, jys = bx + dx * t, by + dy * t
+                    jxt, jyt = cx + dx * s, cy + dy * s
+                    det = jxs * jyt - jxt * jys
+                    s = s - (fx * jyt - fy * jxt) / det
+                    t = t - (jxs * fy - jys * fx) / det
+
+            inside = ~done & (s >= -eps) & (s <= 1 + eps) & (t >= -eps) & (t <= 1 + eps)
+            s = np.clip(s[inside], 0, 1)
+            t = np.clip(t[inside], 0, 1)
+            points = np.nonzero(inside)[0]
+            for (cj, ci), w in zip(corners, [(1 - s) * (1 - t), s * (1 - t), (1 - s) * t, s * t]):
+                rows.append(points)
+                cols.append(cj[inside] * nx + ci[inside])
+                weights.append(w)
+            done |= inside
+
+    outside = np.nonzero(~done)[0]
+    rows.append(outside)
+    cols.append(nearest[outside])
+    weights.append(np.ones(len(outside)))
+
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+
+
+def idw_weights(tree, points, k=4, power=2):
+    """
+    Inverse distance weights of the k nearest source nodes of each destination point.
+
+    Returns:
+        tuple: (rows, cols, weights) triplets of the sparse weight matrix.
+    """
+    distances, neighbours = tree.query(points, k=k)
+    with np.errstate(divide="ignore"):
+        weights = 1.0 / distances ** power
+    # Points lying on a source node take its value
+    exact = distances[:, 0] == 0
+    weights[exact] = 0
+    weights[exact, 0] = 1
+    weights /= weights.sum(axis=1)[:, None]
+    rows = np.repeat(np.arange(len(points)), k)
+    return rows, neighbours.ravel(), weights.ravel()
 
 
 class Interp2D:
-    def __init__(self, srcLons, srcLats, dstLons, dstLats):
+    def __init__(self, srcLons, srcLats, dstLons, dstLats, cache=None, method="nearest", dtype=np.float64):
         self.srcLons = srcLons
         self.srcLats = srcLats
         self.dstLons = dstLons
         self.dstLats = dstLats
+        self.method = method
+        self.dtype = np.dtype(dtype)
+        self.shape = (len(dstLats), len(dstLons))
+
+        if method not in ("nearest", "bilinear", "idw"):
+            raise ValueError("Unknown interpolation method: " + str(method))
+
+        if cache is None:
+            geometry = self.geometry()
+        else:
+            key = cache.key("Interp2D-" + method, srcLons, srcLats, dstLons, dstLats)
+            geometry = cache.fetch(key, self.geometry)
+        self.indices = geometry["indices"]
+
+        self.weights = None
+        if method != "nearest":
+            self.weights = csr_matrix((geometry["weights"], geometry["weights_indices"], geometry["weights_indptr"]),
+                                      shape=(len(self.indices), np.size(srcLons))).astype(self.dtype)
+
+    def geometry(self):
+        # Build the source -> destination nearest neighbour index map once,
+        # so that each interp call is a plain gather
+        tree = cKDTree(np.column_stack((np.ravel(self.srcLons), np.ravel(self.srcLats))))
+        X, Y = np.meshgrid(self.dstLons, self.dstLats)
+        points = np.column_stack((X.ravel(), Y.ravel()))
+        _, indices = tree.query(points)
+        geometry = {"indices": indices}
+
+        # The other methods are a sparse weight matrix applied to the source field
+        if self.method != "nearest":
+            if self.method == "bilinear":
+                rows, cols, weights = bilinear_weights(self.srcLons, self.srcLats, points[:, 0], points[:, 1], indices)
+            else:
+                rows, cols, weights = idw_weights(tree, points)
+            weights = csr_matrix((weights, (rows, cols)), shape=(len(indices), np.size(self.srcLons)))
+            geometry["weights"] = weights.data
+            geometry["weights_indices"] = weights.indices
+            geometry["weights_indptr"] = weights.indptr
+
+        return geometry
+
+    def values(self, invar):
+        # Masked source points are invalid
+        if np.ma.isMaskedArray(invar):
+            return np.ma.filled(invar.astype(self.dtype), np.nan)
+        return np.asarray(invar, dtype=self.dtype)
 
     def interp(self, invar2d, fill_value=1.e+37, invalid_value=1.e+37):
-        py = self.srcLats.flatten()
-        px = self.srcLons.flatten()
-        z = np.array(invar2d).flatten()
+        z = self.values(invar2d).reshape(-1)
+        return self.regrid(z, fill_value, invalid_value).reshape(self.shape)
+
+    def interpLevels(self, invar, fill_value=1.e+37, invalid_value=1.e+37):
+        # Regrid a whole (..., j, i) stack at once into (..., lat, lon)
+        invar = self.values(invar)
+        leading = invar.shape[:-2]
+        z = invar.reshape(leading + (-1,))
+        return self.regrid(z, fill_value, invalid_value).reshape(leading + self.shape)
+
+    def regrid(self, z, fill_value, invalid_value):
+        if self.weights is None:
+            return self.gather(z, fill_value, invalid_value)
+        return self.product(z, fill_value, invalid_value)
+
+    def gather(self, z, fill_value, invalid_value):
+        outvar = np.empty(z.shape[:-1] + (len(self.indices),), dtype=z.dtype)
+        np.take(z, self.indices, axis=-1, out=outvar)
         if invalid_value is not None and not np.isnan(invalid_value):
-            z[z == invalid_value] = np.nan
-        X, Y = np.meshgrid(self.dstLons, self.dstLats)
-        outvar2d = griddata((px, py), z, (X, Y), method='nearest', fill_value=fill_value)
-        outvar2d[np.isnan(outvar2d)] = fill_value
-        return outvar2d
+            outvar[outvar == invalid_value] = fill_value
+        outvar[np.isnan(outvar)] = fill_value
+        return outvar
+
+    def product(self, z, fill_value, invalid_value):
+        leading = z.shape[:-1]
+        z = z.reshape(-1, z.shape[-1]).T
+
+        valid = ~np.isnan(z)
+        if invalid_value is not None and not np.isnan(invalid_value):
+            valid &= z != invalid_value
+
+        # One sparse product for the whole stack, normalising the weights
+        # over the valid source points only
+        outvar = self.weights @ np.where(valid, z, 0)
+        if valid.all():
+            norm = None
+        else:
+            norm = self.weights @ valid.astype(z.dtype)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                outvar /= norm
+
+        # Keep the coverage of the nearest neighbour map, so that land and sea
+        # points do not depend on the interpolation method
+        invalid = ~valid[self.indices]
+        if norm is not None:
+            invalid |= norm == 0
+        outvar[invalid] = fill_value
+
+        return np.ascontiguousarray(outvar.T).reshape(leading + (len(self.indices),))
 
 
 class Interp3D(Interp2D):
-    def __init__(self, srcLons, srcLats, dstLons, dstLats, s_rho, mask, H):
-        super().__init__(srcLons, srcLats, dstLons, dstLats)
+    def __init__(self, srcLons, srcLats, dstLons, dstLats, s_rho, mask, H, cache=None, method="nearest", dtype=np.float64):
+        super().__init__(srcLons, srcLats, dstLons, dstLats, cache, method, dtype)
         self.s_rho = s_rho
         self.H = H
-        self.mask = super().interp(mask, fill_value=0, invalid_value=np.nan)
-        self.mask_indices = np.where(self.mask == 1)
+        # The sigma levels and the depths, in the precision of the kernels
+        self.sigma = np.ma.filled(s_rho, np.nan).astype(self.dtype)
+        self.depth = np.ma.filled(H, np.nan).astype(self.dtype)
+
+        if cache is None:
+            geometry = self.geometry3D(mask)
+        else:
+            key = cache.key("Interp3D", srcLons, srcLats, dstLons, dstLats, s_rho, mask, H)
+            geometry = cache.fetch(key, lambda: self.geometry3D(mask))
+        self.mask = geometry["mask"]
+        self.mask_indices = tuple(geometry["mask_indices"])
+
+        # The deepest depth level of each water column, and the vertical
+        # interpolation weights of its depth levels (ragged, at offsets),
+        # shared by all the variables of the grid
+        self.bottom = bottom_levels(self.sigma, levels, self.mask_indices, self.depth)
+        self.levelOffsets = np.concatenate(([0], np.cumsum(self.bottom + 1)))
+        self.levelLower, self.levelWeights = vertical_weights(self.sigma, levels, self.mask_indices, self.depth,
+                                                              self.levelOffsets)
+
+    def geometry3D(self, mask):
+        # The land/sea mask is categorical: always take the nearest source point
+        mask = self.gather(np.asarray(mask, dtype=np.float64).reshape(-1), 0, np.nan).reshape(self.shape)
+        return {"mask": mask, "mask_indices": np.array(np.where(mask == 1))}
 
     def interp(self, invar3d, fill_value=1.e+37, invalid_value=1.e+37):
-        outvar3d = np.empty((invar3d.shape[0], invar3d.shape[1], len(self.dstLats), len(self.dstLons)))
-        for k in range(invar3d.shape[1]):
-            print(f"Interpolating level: {k}")
-            outvar3d[0, k] = super().interp(invar3d[0, k])
-
-        outvar3dZeta = vertical_interp(self.s_rho.filled(np.nan), outvar3d, depths, self.mask_indices, self.H.filled(np.nan))
-        outvar3dZeta[np.isnan(outvar3dZeta)] = fill_value
-        return outvar3dZeta
-
-    def bottomValues(self, invar3d, invalid_value=1e37):
-        return extract_value_at_bottom(invar3d, invalid_value)
-    
-    def surfaceValues(self, invar3d, factor=1.0, invalid_value=1e37):
-        return extract_value_at_surface(invar3d, factor, invalid_value)
+        return self.interpFields(invar3d, fill_value=fill_value)[0]
+
+    def interpFields(self, invar3d, factor=1.0, fill_value=1.e+37):
+        # The z level cube, the surface values scaled by factor and the bottom
+        # values, in a single pass over the water columns
+        return self.verticalFields(self.interpLevels(invar3d), factor, fill_value)
+
+    def verticalFields(self, outvar3d, factor=1.0, fill_value=1.e+37):
+        # The vertical step of interpFields, on the horizontally regridded
+        # sigma levels; the factor and the fill value are taken in the
+        # precision of the data
+        dtype = outvar3d.dtype.type
+        return vertical_interp(outvar3d, self.mask_indices, self.levelOffsets, self.levelLower, self.levelWeights,
+                               len(levels), dtype(factor), dtype(fill_value))
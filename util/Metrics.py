@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import resource
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class Metrics:
+    """
+    Wall time, CPU time, peak RSS and bytes read and written by the stages of
+    the processing of each source file.
+
+    The stages of a file are accumulated between begin() and end(), which
+    appends one JSON line per stage (and one for the whole file) to the
+    metrics file, or rewrites it as a Prometheus textfile with the metrics of
+    the last file. Without a metrics file nothing is measured.
+
+    The bytes are those read and written by the process (/proc/self/io, on
+    Linux only), the peak RSS is the high-water mark of the process at the end
+    of the stage.
+    """
+
+    # Prometheus metric name, help -> stage record key
+    gauges = {
+        "wall": ("postpro_stage_wall_seconds", "Wall time of the stage"),
+        "cpu": ("postpro_stage_cpu_seconds", "CPU time of the stage, all threads"),
+        "peak_rss": ("postpro_stage_peak_rss_bytes", "Peak resident set size of the process at the end of the stage"),
+        "read_bytes": ("postpro_stage_read_bytes", "Bytes read by the stage"),
+        "write_bytes": ("postpro_stage_written_bytes", "Bytes written by the stage"),
+    }
+
+    def __init__(self, path=None, format=None, product=None):
+        if format not in (None, "jsonl", "prometheus"):
+            raise ValueError("Unknown metrics format: " + str(format))
+        self.path = path
+        self.format = format or ("prometheus" if path and path.endswith(".prom") else "jsonl")
+        self.product = product
+        self.source = None
+        self.started = None
+        self.stages = {}
+
+    @staticmethod
+    def addArguments(parser):
+        parser.add_argument("--metrics", metavar="FILE", default=os.environ.get("POSTPRO_METRICS"),
+                            help="per-stage timing and memory metrics file (default: $POSTPRO_METRICS)")
+        parser.add_argument("--metrics-format", choices=["jsonl", "prometheus"],
+                            help="JSON lines appended per file, or a Prometheus textfile of the last file "
+                                 "(default: prometheus for .prom files, else jsonl)")
+
+    @staticmethod
+    def fromArguments(args, product):
+        return Metrics(args.metrics, args.metrics_format, product)
+
+    def sample(self):
+        sample = {"wall": time.perf_counter(), "cpu": time.process_time(), "read_bytes": 0, "write_bytes": 0}
+        try:
+            with open("/proc/self/io") as f:
+                for line in f:
+                    key, value = line.split(":")
+                    if key == "rchar":
+                        sample["read_bytes"] = int(value)
+                    elif key == "wchar":
+                        sample["write_bytes"] = int(value)
+        except OSError:
+            pass
+        return sample
+
+    @contextmanager
+    def stage(self, name):
+        if not self.path:
+            yield
+            return
+        start = self.sample()
+        try:
+            yield
+        finally:
+            end = self.sample()
+            self.add(name, {key: end[key] - start[key] for key in start})
+
+    def add(self, name, values):
+        # Accumulate the stage, also with the values measured by a worker
+        stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "peak_rss": 0, "read_bytes": 0,
+                                              "write_bytes": 0})
+        for key in ("wall", "cpu", "read_bytes", "write_bytes"):
+            stage[key] += values[key]
+        stage["peak_rss"] = max(stage["peak_rss"], values.get("peak_rss", 0),
+                                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    def merge(self, stages):
+        for name, values in stages.items():
+            self.add(name, values)
+
+    def begin(self, source):
+        self.source = source
+        self.stages = {}
+        self.started = self.sample() if self.path else None
+
+    def end(self):
+        if not self.path:
+            return
+        end = self.sample()
+        total = {key: end[key] - self.started[key] for key in end}
+        total["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        records = [dict(stage=name, **values) for name, values in self.stages.items()]
+        records.append(dict(stage="total", **total))
+
+        if self.format == "jsonl":
+            now = datetime.now().isoformat(timespec="seconds")
+            with open(self.path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(dict(time=now, product=self.product, source=self.source, **record)) + "\n")
+        else:
+            self.writeTextfile(records)
+
+    def writeTextfile(self, records):
+        # Written into a temporary file and renamed, so that the collector
+        # never reads a partial file
+        lines = []
+        for key, (metric, description) in self.gauges.items():
+            lines.append("# HELP " + metric + " " + description + ", last processed file.")
+            lines.append("# TYPE " + metric + " gauge")
+            for record in records:
+                lines.append(metric + '{product="' + str(self.product) + '",stage="' + record["stage"] + '"} ' +
+                             repr(float(record[key])))
+        lines.append("# HELP postpro_last_file_timestamp_seconds Time the last file was processed.")
+        lines.append("# TYPE postpro_last_file_timestamp_seconds gauge")
+        lines.append('postpro_last_file_timestamp_seconds{product="' + str(self.product) + '"} ' + repr(time.time()))
+
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".prom", dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, self.path)
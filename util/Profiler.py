@@ -0,0 +1,117 @@
+import io
+import os
+import re
+import sys
+import time
+import atexit
+import pstats
+import cProfile
+from numba.core import event
+
+# The numba kernels are compiled when util.Interpolator is imported: this
+# module is imported first, so that the compilations are timed from the start
+compileTimer = event.TimingListener()
+compileRecorder = event.RecordingListener()
+event.register("numba:compile", compileTimer)
+event.register("numba:compile", compileRecorder)
+
+# With $POSTPRO_PROFILE the profile covers the imports as well
+started = time.time()
+profile = None
+if os.environ.get("POSTPRO_PROFILE"):
+    profile = cProfile.Profile()
+    profile.enable()
+
+# Packages the self time of the profiled functions is grouped by
+packages = ["numba", "llvmlite", "numpy", "scipy", "netCDF4", "wrf", "xarray", "multiprocessing"]
+
+
+class Profiler:
+    """
+    Opt-in profiling of a run.
+
+    The run is profiled with cProfile, and at exit the stats are dumped to the
+    profile file (for pstats or snakeviz) and a short summary is written next
+    to it (profile file + ".txt") and printed: wall and CPU time, the numba
+    compilation time apart from the execution, the self time by package, and
+    the top hotspots by self time.
+    """
+
+    def __init__(self, path=None, top=25):
+        self.path = path
+        self.top = top
+        self.profile = None
+
+    @staticmethod
+    def addArguments(parser):
+        parser.add_argument("--profile", metavar="FILE", default=os.environ.get("POSTPRO_PROFILE"),
+                            help="profile the run and dump the pstats to FILE, with a summary in FILE.txt "
+                                 "(default: $POSTPRO_PROFILE, which also profiles the imports)")
+        parser.add_argument("--profile-top", type=int, default=25, metavar="N",
+                            help="hotspots listed in the profile summary (default: 25)")
+
+    @staticmethod
+    def fromArguments(args):
+        return Profiler(args.profile, args.profile_top)
+
+    def start(self):
+        if not self.path:
+            return
+        global profile
+        if profile is None:
+            profile = cProfile.Profile()
+            profile.enable()
+        self.profile = profile
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+        summary = self.summary()
+        with open(self.path + ".txt", "w") as f:
+            f.write(summary)
+        print(summary)
+        self.profile = None
+
+    def summary(self):
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+
+        wall = time.time() - started
+        compiled = compileTimer.duration if compileTimer.done else 0.0
+        compilations = sum(1 for _, record in compileRecorder.buffer if record.is_start)
+        lines = ["Profile: " + " ".join(sys.argv),
+                 "Wall time: %.3f s, CPU time: %.3f s (process)" % (wall, time.process_time()),
+                 "Numba compilation: %.3f s (%d signatures), execution and the rest: %.3f s" %
+                 (compiled, compilations, wall - compiled),
+                 "",
+                 "Self time by package:"]
+
+        byPackage = {}
+        for (filename, _, function), (_, _, selfTime, _, _) in stats.stats.items():
+            package = self.package(filename, function)
+            byPackage[package] = byPackage.get(package, 0.0) + selfTime
+        for package, selfTime in sorted(byPackage.items(), key=lambda item: -item[1]):
+            lines.append("  %-16s %10.3f s" % (package, selfTime))
+
+        lines += ["", "Top " + str(self.top) + " hotspots by self time:"]
+        stats.sort_stats("tottime").print_stats(self.top)
+        # Keep the table of the pstats report only
+        report = stream.getvalue()
+        table = report[report.find("   ncalls"):] if "   ncalls" in report else report
+        return "\n".join(lines) + "\n" + table.rstrip() + "\n"
+
+    @staticmethod
+    def package(filename, function):
+        # Built-in functions and methods carry their module in their name
+        text = function if filename == "~" else filename
+        for package in packages:
+            if re.search(r"(^|[/\\.<' ])" + package + r"([/\\._]|$)", text):
+                return package
+        if filename == "~":
+            return "builtins"
+        if "site-packages" in filename or "dist-packages" in filename:
+            return "other packages"
+        return "postpro" if os.path.dirname(os.path.dirname(os.path.abspath(__file__))) in filename else "python"
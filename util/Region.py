@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def nearest(axis, values):
+    # The indices of the points of an ascending axis nearest to the values
+    upper = np.clip(np.searchsorted(axis, values), 1, len(axis) - 1)
+    lower = upper - 1
+    return np.where(values - axis[lower] <= axis[upper] - values, lower, upper)
+
+
+class Region:
+    """
+    Region of interest of the outputs: a longitude/latitude box and,
+    optionally, the resolution of a regular destination grid over it.
+
+    The destination grid is restricted to the box, and the source fields are
+    read over the window of the source grid covering it only, plus a margin of
+    source cells, so that a small region costs in proportion to its area.
+    Without the resolution the destination points are those of the whole
+    grid falling in the box. Without a box the whole domain is processed.
+    """
+
+    def __init__(self, bbox=None, resolution=None, margin=4):
+        self.bbox = bbox
+        self.resolution = resolution
+        self.margin = margin
+        if bbox is not None and (bbox[0] >= bbox[2] or bbox[1] >= bbox[3]):
+            raise ValueError("Empty region: " + str(bbox))
+        if resolution is not None and resolution <= 0:
+            raise ValueError("Invalid resolution: " + str(resolution))
+
+    @staticmethod
+    def addArguments(parser):
+        parser.add_argument("--bbox", nargs=4, type=float, metavar=("WEST", "SOUTH", "EAST", "NORTH"),
+                            help="restrict the output to a longitude/latitude box (default: the whole domain)")
+        parser.add_argument("--resolution", type=float, metavar="DEGREES",
+                            help="spacing of a regular output grid over the --bbox box "
+                                 "(default: the points of the whole grid in the box)")
+        parser.add_argument("--bbox-margin", type=int, default=4, metavar="CELLS",
+                            help="source cells read around the --bbox box (default: 4)")
+
+    @staticmethod
+    def fromArguments(args):
+        if args.resolution is not None and args.bbox is None:
+            raise ValueError("--resolution needs --bbox")
+        return Region(args.bbox, args.resolution, args.bbox_margin)
+
+    def axes(self, dstLon, dstLat):
+        """
+        The longitude and latitude axes of the destination grid in the region.
+        """
+        if self.bbox is None:
+            return dstLon, dstLat
+        west, south, east, north = self.bbox
+        if self.resolution:
+            # A regular grid over the box, within the extent of the whole grid
+            west, east = max(west, np.min(dstLon)), min(east, np.max(dstLon))
+            south, north = max(south, np.min(dstLat)), min(north, np.max(dstLat))
+            lon = np.arange(west, east + self.resolution / 2, self.resolution) if west <= east else []
+            lat = np.arange(south, north + self.resolution / 2, self.resolution) if south <= north else []
+        else:
+            lon = dstLon[(dstLon >= west) & (dstLon <= east)]
+            lat = dstLat[(dstLat >= south) & (dstLat <= north)]
+        if len(lon) == 0 or len(lat) == 0:
+            raise ValueError("The region " + str(self.bbox) + " is outside the domain")
+        return lon, lat
+
+    def window(self, srcLons, srcLats, dstLon, dstLat):
+        """
+        The (eta, xi) slices of a source grid covering the destination grid,
+        plus the margin; without a box, the whole source grid.
+        """
+        ny, nx = np.shape(srcLons)
+        if self.bbox is None:
+            return slice(0, ny), slice(0, nx)
+        lon = np.ma.getdata(srcLons)
+        lat = np.ma.getdata(srcLats)
+        inside = ((lon >= np.min(dstLon)) & (lon <= np.max(dstLon)) &
+                  (lat >= np.min(dstLat)) & (lat <= np.max(dstLat)))
+        rows, cols = np.nonzero(inside)
+        if len(rows) == 0:
+            # A region smaller than a source cell: around the source point
+            # nearest to its centre
+            distance = (lon - np.mean(dstLon)) ** 2 + (lat - np.mean(dstLat)) ** 2
+            rows, cols = np.unravel_index([np.argmin(distance)], distance.shape)
+        return (slice(max(rows.min() - self.margin, 0), min(rows.max() + self.margin + 1, ny)),
+                slice(max(cols.min() - self.margin, 0), min(cols.max() + self.margin + 1, nx)))
+
+    def subset(self, field, dstLon, dstLat, lon, lat):
+        """
+        A field on the whole destination grid (dstLon, dstLat), at its points
+        nearest to those of the grid of the region (lon, lat).
+        """
+        if self.bbox is None:
+            return field
+        return field[np.ix_(nearest(dstLat, lat), nearest(dstLon, lon))]
@@ -0,0 +1,69 @@
+import os
+import time
+import subprocess
+
+
+class Scheduler:
+    """
+    Jobs run as child processes, at most jobs at a time, each once the jobs
+    it depends on have ended.
+
+    At most heavy of the jobs marked as heavy run at a time, to bound the
+    memory of the run. A job whose dependency failed still runs: the
+    dependencies only order the jobs. The ready jobs are started in the order
+    they were added. The output of each job goes to its log file.
+    """
+
+    def __init__(self, jobs=1, heavy=1, env=None):
+        self.jobs = max(1, jobs)
+        self.heavy = max(1, heavy)
+        self.env = env
+        self.pending = {}
+        self.order = []
+        self.running = {}
+        self.results = {}
+
+    def add(self, name, command, log, depends=(), heavy=False):
+        self.pending[name] = {"command": command, "log": log, "depends": set(depends) & set(self.pending),
+                              "heavy": heavy}
+        self.order.append(name)
+
+    def ready(self, name):
+        job = self.pending[name]
+        if any(depend in self.pending or depend in self.running for depend in job["depends"]):
+            return False
+        if len(self.running) >= self.jobs:
+            return False
+        return not job["heavy"] or sum(1 for running in self.running.values() if running["heavy"]) < self.heavy
+
+    def start(self, name):
+        job = self.pending.pop(name)
+        os.makedirs(os.path.dirname(os.path.abspath(job["log"])), exist_ok=True)
+        with open(job["log"], "w") as log:
+            job["process"] = subprocess.Popen(job["command"], stdout=log, stderr=subprocess.STDOUT, env=self.env)
+        job["started"] = time.perf_counter()
+        self.running[name] = job
+        print(name + "...")
+
+    def run(self, poll=0.2):
+        """
+        Run all the jobs and return {name: (exit status, seconds)}.
+        """
+        while self.pending or self.running:
+            for name in [name for name in self.order if name in self.pending]:
+                if self.ready(name):
+                    self.start(name)
+
+            time.sleep(poll)
+            for name, job in list(self.running.items()):
+                status = job["process"].poll()
+                if status is None:
+                    continue
+                elapsed = time.perf_counter() - job["started"]
+                del self.running[name]
+                self.results[name] = (status, elapsed)
+                if status == 0:
+                    print("..." + name + " (" + "%.1f" % elapsed + " s)")
+                else:
+                    print("..." + name + " FAILED with status " + str(status) + ", see " + job["log"])
+        return self.results
@@ -0,0 +1,77 @@
+import os
+import re
+import time
+import tempfile
+import numpy as np
+
+
+class State:
+    """
+    Interpolated fields saved by a run for the runs of the following hours.
+
+    The fields of each grid and valid time are stored as one .npz file in the
+    state directory, written into a temporary file and renamed into place. The
+    fields of the current batch are kept in memory as well, so within a batch
+    the state directory is optional. State files older than max_age seconds
+    are removed; the other files of the directory are left alone.
+    """
+
+    # The state files, and the temporary files of the runs killed while saving
+    pattern = re.compile(r"(.+-\d{8}Z\d{4}|\.tmp-.+)\.npz$")
+
+    def __init__(self, path=None, max_age=2 * 86400):
+        self.path = path
+        self.max_age = max_age
+        self.memory = {}
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def addArguments(parser):
+        parser.add_argument("--state-dir", default=os.environ.get("POSTPRO_STATE_DIR"),
+                            help="directory of the interpolated fields saved for the next hours "
+                                 "(default: $POSTPRO_STATE_DIR)")
+
+    @staticmethod
+    def fromArguments(args):
+        return State(args.state_dir)
+
+    def filename(self, key, validTime):
+        return os.path.join(self.path, key + "-" + validTime.strftime("%Y%m%dZ%H%M") + ".npz")
+
+    def load(self, key, validTime):
+        if (key, validTime) in self.memory:
+            return self.memory[(key, validTime)]
+        if not self.path:
+            return None
+        try:
+            with np.load(self.filename(key, validTime)) as npz:
+                return {name: npz[name] for name in npz.files}
+        except (OSError, ValueError):
+            # Missing, or left truncated by a killed run
+            return None
+
+    def save(self, key, validTime, arrays, keep=()):
+        # In memory, keep only these fields and the ones still needed
+        self.memory = {k: v for k, v in self.memory.items() if k[1] in keep}
+        self.memory[(key, validTime)] = arrays
+
+        if not self.path:
+            return
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".npz", dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self.filename(key, validTime))
+        self.evict()
+
+    def evict(self):
+        # Only the state files and the leftovers of killed runs: the state
+        # directory may be shared with other data
+        for entry in os.scandir(self.path):
+            try:
+                if not self.pattern.match(entry.name) or not entry.is_file(follow_symlinks=False):
+                    continue
+                if time.time() - entry.stat().st_mtime > self.max_age:
+                    os.remove(entry.path)
+            except OSError:
+                continue
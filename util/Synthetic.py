@@ -0,0 +1,170 @@
+import numpy as np
+from datetime import datetime
+from netCDF4 import Dataset
+
+
+class Synthetic:
+    """
+    Model output shaped like the sources of the postprocessors, for benchmarks.
+
+    The files have the variables, dimensions and attributes each script reads,
+    on a curvilinear grid of ny x nx points over the Gulf of Naples with a
+    coast along the west side, levels vertical levels and records time
+    records. The values are smooth fields plus noise, from a fixed seed.
+    """
+
+    def __init__(self, ny=200, nx=250, levels=30, records=1, seed=0):
+        self.ny = ny
+        self.nx = nx
+        self.levels = levels
+        self.records = records
+        self.seed = seed
+
+    def coordinates(self, ny, nx, dj=0.0, di=0.0, step=0.01):
+        # A slightly rotated grid, staggered by (dj, di) cells
+        j, i = np.mgrid[0:ny, 0:nx]
+        lon = 13.8 + step * (i + di) + 0.1 * step * (j + dj)
+        lat = 40.4 + step * (j + dj) + 0.05 * step * (i + di)
+        return lon, lat
+
+    def field(self, rng, shape, scale, offset=0.0):
+        # Smooth along the horizontal axes, with some noise
+        ny, nx = shape[-2:]
+        j, i = np.mgrid[0:ny, 0:nx]
+        smooth = np.sin(j / max(ny, 1) * 3.0) * np.cos(i / max(nx, 1) * 2.0)
+        return (offset + scale * (smooth + 0.1 * rng.standard_normal(shape))).astype(np.float32)
+
+    def ocean(self, path, variables):
+        # ROMS-shaped file: rho, u and v grids, sigma levels, land masked
+        rng = np.random.default_rng(self.seed)
+        ny, nx, nk, nt = self.ny, self.nx, self.levels, self.records
+        ncfile = Dataset(path, "w", format="NETCDF4")
+        ncfile.createDimension("ocean_time", None)
+        ncfile.createDimension("s_rho", nk)
+        grids = {"rho": (ny, nx, 0.0, 0.0), "u": (ny, nx - 1, 0.0, 0.5), "v": (ny - 1, nx, 0.5, 0.0)}
+        masks = {}
+        for grid, (gy, gx, dj, di) in grids.items():
+            ncfile.createDimension("eta_" + grid, gy)
+            ncfile.createDimension("xi_" + grid, gx)
+            lon, lat = self.coordinates(gy, gx, dj, di)
+            dimensions = ("eta_" + grid, "xi_" + grid)
+            ncfile.createVariable("lon_" + grid, "f8", dimensions)[:] = lon
+            ncfile.createVariable("lat_" + grid, "f8", dimensions)[:] = lat
+            # Land on the west side, with a wavy coastline
+            j, i = np.mgrid[0:gy, 0:gx]
+            masks[grid] = (i + di > gx * (0.2 + 0.1 * np.sin(j / 15.0))).astype(np.float64)
+            ncfile.createVariable("mask_" + grid, "f8", dimensions)[:] = masks[grid]
+
+        ncfile.createVariable("ocean_time", "f8", ("ocean_time",))[:] = np.arange(nt) * 3600.0
+        ncfile.createVariable("s_rho", "f8", ("s_rho",))[:] = (np.arange(nk) - nk + 0.5) / nk
+        j, i = np.mgrid[0:ny, 0:nx]
+        ncfile.createVariable("h", "f8", ("eta_rho", "xi_rho"))[:] = 5.0 + 1500.0 * (i / nx) ** 2 + 20 * np.sin(j / 7.0)
+
+        for name, grid, scale, offset in variables:
+            if name in ("zeta", "ubar", "vbar"):
+                dimensions = ("ocean_time", "eta_" + grid, "xi_" + grid)
+            else:
+                dimensions = ("ocean_time", "s_rho", "eta_" + grid, "xi_" + grid)
+            shape = [nt] + [len(ncfile.dimensions[dimension]) for dimension in dimensions[1:]]
+            variable = ncfile.createVariable(name, "f4", dimensions, fill_value=1e37)
+            for n in range(nt):
+                values = self.field(rng, shape[1:], scale, offset)
+                variable[n] = np.ma.masked_where(np.broadcast_to(masks[grid] == 0, values.shape), values)
+        ncfile.close()
+
+    def roms(self, path):
+        self.ocean(path, [("zeta", "rho", 0.5, 0.0), ("temp", "rho", 5.0, 15.0), ("salt", "rho", 1.0, 38.0),
+                          ("u", "u", 0.5, 0.0), ("ubar", "u", 0.2, 0.0), ("v", "v", 0.5, 0.0),
+                          ("vbar", "v", 0.2, 0.0)])
+
+    def wacomm(self, path):
+        self.ocean(path, [("conc", "rho", 5.0, 5.0)])
+
+    def ww33(self, path):
+        # WW3-shaped file: a regular grid, land as missing values
+        rng = np.random.default_rng(self.seed)
+        ny, nx, nt = self.ny, self.nx, self.records
+        ncfile = Dataset(path, "w", format="NETCDF4")
+        ncfile.createDimension("time", None)
+        ncfile.createDimension("latitude", ny)
+        ncfile.createDimension("longitude", nx)
+        ncfile.createVariable("time", "f8", ("time",))[:] = 19723.0 + np.arange(nt) / 24.0
+        ncfile.createVariable("latitude", "f4", ("latitude",))[:] = 39.0 + 0.05 * np.arange(ny)
+        ncfile.createVariable("longitude", "f4", ("longitude",))[:] = 13.0 + 0.05 * np.arange(nx)
+        land = np.zeros((ny, nx), dtype=bool)
+        land[:, :nx // 5] = True
+        for name, scale, offset in (("dpt", 100.0, 200.0), ("hs", 1.0, 1.5), ("lm", 20.0, 50.0),
+                                    ("fp", 0.05, 0.15), ("dir", 90.0, 180.0), ("t0m1", 2.0, 5.0)):
+            variable = ncfile.createVariable(name, "f4", ("time", "latitude", "longitude"), fill_value=1e37)
+            values = self.field(rng, (nt, ny, nx), scale, offset)
+            variable[:] = np.ma.masked_where(np.broadcast_to(land, values.shape), values)
+        ncfile.close()
+
+    def wrf(self, path, validTime=datetime(2024, 1, 1, 0)):
+        # WRF-shaped file: one record of the variables read by postpro-wrf5.py
+        # and by the wrf-python diagnostics it calls
+        rng = np.random.default_rng(self.seed + validTime.hour)
+        ny, nx, nk = self.ny, self.nx, self.levels
+        ncfile = Dataset(path, "w", format="NETCDF4")
+        for dimension, size in (("Time", None), ("DateStrLen", 19), ("bottom_top", nk), ("bottom_top_stag", nk + 1),
+                                ("south_north", ny), ("south_north_stag", ny + 1), ("west_east", nx),
+                                ("west_east_stag", nx + 1)):
+            ncfile.createDimension(dimension, size)
+
+        times = ncfile.createVariable("Times", "S1", ("Time", "DateStrLen"))
+        times[0] = np.array(list(validTime.strftime("%Y-%m-%d_%H:%M:%S")), dtype="S1")
+
+        mass = ("Time", "south_north", "west_east")
+        lon, lat = self.coordinates(ny, nx, step=0.025)
+        lonU, latU = self.coordinates(ny, nx + 1, 0.0, -0.5, 0.025)
+        lonV, latV = self.coordinates(ny + 1, nx, -0.5, 0.0, 0.025)
+        for name, dimensions, values in (
+                ("XLAT", mass, lat), ("XLONG", mass, lon),
+                ("XLAT_U", ("Time", "south_north", "west_east_stag"), latU),
+                ("XLONG_U", ("Time", "south_north", "west_east_stag"), lonU),
+                ("XLAT_V", ("Time", "south_north_stag", "west_east"), latV),
+                ("XLONG_V", ("Time", "south_north_stag", "west_east"), lonV),
+                ("HGT", mass, np.clip(self.field(rng, (ny, nx), 400.0, 100.0), 0, None)),
+                ("PSFC", mass, self.field(rng, (ny, nx), 500.0, 101000.0)),
+                ("T2", mass, self.field(rng, (ny, nx), 5.0, 285.0)),
+                ("Q2", mass, np.abs(self.field(rng, (ny, nx), 0.002, 0.008))),
+                ("U10", mass, self.field(rng, (ny, nx), 5.0)),
+                ("V10", mass, self.field(rng, (ny, nx), 5.0)),
+                ("SR", mass, np.abs(self.field(rng, (ny, nx), 0.5))),
+                ("RAINC", mass, np.abs(self.field(rng, (ny, nx), 2.0, validTime.hour))),
+                ("RAINNC", mass, np.abs(self.field(rng, (ny, nx), 2.0, validTime.hour))),
+                ("RAINSH", mass, np.abs(self.field(rng, (ny, nx), 0.1))),
+                ("MAPFAC_M", mass, np.ones((ny, nx))),
+                ("SINALPHA", mass, np.zeros((ny, nx))),
+                ("COSALPHA", mass, np.ones((ny, nx)))):
+            ncfile.createVariable(name, "f4", dimensions)[0] = values
+
+        # A standard atmosphere with perturbations: pressure decreasing and
+        # geopotential increasing with height
+        eta = np.linspace(0.995, 0.02, nk)[:, None, None]
+        etaStag = np.linspace(1.0, 0.0, nk + 1)[:, None, None]
+        pb = 5000.0 + 96000.0 * eta * np.ones((ny, nx))
+        phb = 9.81 * -7000.0 * np.log(np.maximum(etaStag, 0.005)) * np.ones((ny, nx))
+        levels = ("Time", "bottom_top", "south_north", "west_east")
+        stagged = ("Time", "bottom_top_stag", "south_north", "west_east")
+        for name, dimensions, values in (
+                ("PB", levels, pb),
+                ("P", levels, self.field(rng, (nk, ny, nx), 100.0)),
+                ("PHB", stagged, phb),
+                ("PH", stagged, self.field(rng, (nk + 1, ny, nx), 10.0)),
+                ("T", levels, self.field(rng, (nk, ny, nx), 2.0, 5.0 + 40.0 * (1 - eta))),
+                ("QVAPOR", levels, np.abs(self.field(rng, (nk, ny, nx), 0.001, 0.01 * eta))),
+                ("QCLOUD", levels, np.abs(self.field(rng, (nk, ny, nx), 1e-5))),
+                ("U", ("Time", "bottom_top", "south_north", "west_east_stag"), self.field(rng, (nk, ny, nx + 1), 10.0)),
+                ("V", ("Time", "bottom_top", "south_north_stag", "west_east"), self.field(rng, (nk, ny + 1, nx), 10.0)),
+                ("W", stagged, self.field(rng, (nk + 1, ny, nx), 0.5))):
+            ncfile.createVariable(name, "f4", dimensions)[0] = values
+        ncfile.createVariable("ZNU", "f4", ("Time", "bottom_top"))[0] = eta.ravel()
+        ncfile.createVariable("ZNW", "f4", ("Time", "bottom_top_stag"))[0] = etaStag.ravel()
+
+        # Lambert conformal projection, 2.5 km
+        ncfile.setncatts({"DX": 2500.0, "DY": 2500.0, "MAP_PROJ": 1, "TRUELAT1": 40.0, "TRUELAT2": 42.0,
+                          "STAND_LON": 14.5, "CEN_LAT": float(lat.mean()), "CEN_LON": float(lon.mean()),
+                          "MOAD_CEN_LAT": float(lat.mean()), "POLE_LAT": 90.0, "POLE_LON": 0.0,
+                          "SIMULATION_START_DATE": "2024-01-01_00:00:00"})
+        ncfile.close()
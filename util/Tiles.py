@@ -0,0 +1,49 @@
+import os
+import numpy as np
+
+
+class Tiles:
+    """
+    Blocks of the destination grid, interpolated one at a time so that the
+    memory of the 3D fields is bounded by the block size.
+
+    Each tile reads the window of the source grid covering the nearest source
+    points of its points, plus a halo of source cells so that the bilinear and
+    idw stencils of its edge points are the same as on the whole grid. Without
+    a size the whole grid is a single tile.
+    """
+
+    def __init__(self, size=None, halo=4):
+        self.size = size
+        self.halo = halo
+
+    @staticmethod
+    def addArguments(parser):
+        parser.add_argument("--tile", type=int, metavar="N",
+                            default=int(os.environ["POSTPRO_TILE"]) if os.environ.get("POSTPRO_TILE") else None,
+                            help="interpolate the destination grid in tiles of N x N points "
+                                 "(default: $POSTPRO_TILE, else the whole grid)")
+        parser.add_argument("--tile-halo", type=int, default=4, metavar="CELLS",
+                            help="source cells read around each tile (default: 4)")
+
+    @staticmethod
+    def fromArguments(args):
+        return Tiles(args.tile, args.tile_halo)
+
+    def split(self, shape):
+        """
+        The (latitude, longitude) slices of the tiles of a destination grid, row by row.
+        """
+        ny, nx = shape
+        size = self.size or max(ny, nx, 1)
+        return [(slice(j, min(j + size, ny)), slice(i, min(i + size, nx)))
+                for j in range(0, ny, size) for i in range(0, nx, size)]
+
+    def window(self, nearest, shape):
+        """
+        The (eta, xi) slices of a source grid of the given shape covering the
+        nearest source points of the points of a tile, plus the halo.
+        """
+        rows, cols = np.divmod(np.ravel(nearest), shape[1])
+        return (slice(max(rows.min() - self.halo, 0), min(rows.max() + self.halo + 1, shape[0])),
+                slice(max(cols.min() - self.halo, 0), min(cols.max() + self.halo + 1, shape[1])))
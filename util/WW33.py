@@ -1,8 +1,19 @@
 from netCDF4 import Dataset
+from util.Archive import Archive
+from util.Encoding import Encoding
 
 
-class WW33:
-    def __init__(self, filename, time, lons, lats):
+class WW33(Archive):
+    fields = {
+        "dpt": "dpt",
+        "hs": "hs",
+        "lm": "lm",
+        "fp": "fp",
+        "dir": "dir",
+        "period": "period",
+    }
+
+    def __init__(self, filename, time, lons, lats, encoding=None):
         self.lons = lons
         self.lats = lats
         self.time = time
@@ -14,6 +25,7 @@ class WW33:
         self.dir = None
         self.period = None
 
+        self.encoding = encoding or Encoding()
         self.ncdstfile = Dataset(filename, "w", format="NETCDF4")
 
         self.ncdstfile.createDimension("time", size=1)
@@ -49,7 +61,7 @@ class WW33:
         self.latVar.valid_max = 90.0
         self.latVar.axis = "Y"
 
-        self.dptVar = self.ncdstfile.createVariable("dpt", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.dptVar = self.createVariable("dpt", ("time", "latitude", "longitude"))
         self.dptVar.description = "Depth"
         self.dptVar.long_name = "depth" 
         self.dptVar.standard_name = "depth" 
@@ -60,7 +72,7 @@ class WW33:
         self.dptVar.valid_min = -90000
         self.dptVar.valid_max = 140000
 
-        self.hsVar = self.ncdstfile.createVariable("hs", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.hsVar = self.createVariable("hs", ("time", "latitude", "longitude"))
         self.hsVar.description = "Significant wave height"
         self.hsVar.long_name = "significant height of wind and swell waves" 
         self.hsVar.standard_name = "sea_surface_wave_significant_height" 
@@ -71,7 +83,7 @@ class WW33:
         self.hsVar.valid_min = 0.0
         self.hsVar.valid_max = 100.0
 
-        self.lmVar = self.ncdstfile.createVariable("lm", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.lmVar = self.createVariable("lm", ("time", "latitude", "longitude"))
         self.lmVar.description = "Mean weave length"
         self.lmVar.long_name = "mean wave length" 
         self.lmVar.standard_name = "mean_wave_length" 
@@ -82,7 +94,7 @@ class WW33:
         self.lmVar.valid_min = 0 
         self.lmVar.valid_max = 3200 
 
-        self.fpVar = self.ncdstfile.createVariable("fp", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.fpVar = self.createVariable("fp", ("time", "latitude", "longitude"))
         self.fpVar.description = "Wave peak frequency"
         self.fpVar.long_name = "wave peak frequency" 
         self.fpVar.standard_name = "sea_surface_wave_peak_frequency" 
@@ -93,7 +105,7 @@ class WW33:
         self.fpVar.valid_min = 0 
         self.fpVar.valid_max = 10000 
 
-        self.dirVar = self.ncdstfile.createVariable("dir", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.dirVar = self.createVariable("dir", ("time", "latitude", "longitude"))
         self.dirVar.description = "Wave mean direction"
         self.dirVar.long_name = "wave mean direction" 
         self.dirVar.standard_name = "sea_surface_wave_from_direction" 
@@ -104,7 +116,7 @@ class WW33:
         self.dirVar.valid_min = 0 
         self.dirVar.valid_max = 3600 
 
-        self.periodVar = self.ncdstfile.createVariable("period", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.periodVar = self.createVariable("period", ("time", "latitude", "longitude"))
         self.periodVar.description = "Mean period"
         self.periodVar.long_name = "mean period T0m1"
         self.periodVar.standard_name = "sea_surface_wind_wave_mean_period_from_variance_spectral_density_inverse_frequency_moment"
@@ -113,20 +125,8 @@ class WW33:
         self.periodVar.scale_factor = 1.0
         self.periodVar.add_offset = 0.0
         self.periodVar.valid_min = 0
-        self.periodVar.valid_max = 5000 
+        self.periodVar.valid_max = 5000
 
-    def write(self):
         self.timeVar[:] = self.time
         self.lonVar[:] = self.lons
         self.latVar[:] = self.lats
-
-        self.dptVar[:] = self.dpt
-        self.hsVar[:] = self.hs
-        self.lmVar[:] = self.lm
-        self.fpVar[:] = self.fp
-        self.dirVar[:] = self.dir
-        self.periodVar[:] = self.period
-
-    def close(self):
-        if self.ncdstfile:
-            self.ncdstfile.close()
\ No newline at end of file
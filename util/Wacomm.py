@@ -1,8 +1,18 @@
 from netCDF4 import Dataset
+from util.Archive import Archive
+from util.Encoding import Encoding
 
 
-class Wacomm:
-    def __init__(self, filename, time, depths, lons, lats):
+class Wacomm(Archive):
+    fields = {
+        "conc": "conc",
+        "sfconc": "sfconc",
+        "sfconc10m": "sfconc_10m",
+        "sfconc30m": "sfconc_30m",
+        "mask": "mask",
+    }
+
+    def __init__(self, filename, time, depths, lons, lats, encoding=None):
         self.lons = lons
         self.lats = lats
         self.depths = depths
@@ -14,9 +24,10 @@ class Wacomm:
         self.sfconc_30m = None
         self.mask = None
 
+        self.encoding = encoding or Encoding()
         self.ncdstfile = Dataset(filename, "w", format="NETCDF4")
 
-        self.ncdstfile.createDimension("time", size=1)
+        self.ncdstfile.createDimension("time", size=None)
         self.ncdstfile.createDimension("depth", size=len(depths))
         self.ncdstfile.createDimension("latitude", size=len(lats))
         self.ncdstfile.createDimension("longitude", size=len(lons))
@@ -51,43 +62,32 @@ class Wacomm:
         self.latVar.standard_name = "latitude"
         self.latVar.axis = "Y"
 
-        self.maskVar = self.ncdstfile.createVariable("mask", "f4", ("latitude", "longitude"), fill_value=1.e37, zlib=True, complevel=4)
+        self.maskVar = self.createVariable("mask", ("latitude", "longitude"))
         self.maskVar.option_0 = "land"
         self.maskVar.option_1 = "water"
         self.maskVar.long_name = "mask on RHO points"
 
-        self.concVar = self.ncdstfile.createVariable("conc", "f4", ("time", "depth", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.concVar = self.createVariable("conc", ("time", "depth", "latitude", "longitude"))
         self.concVar.description = "concentration of suspended matter in sea water"
         self.concVar.units = "1"
         self.concVar.long_name = "concentration"
 
-        self.sfconcVar = self.ncdstfile.createVariable("sfconc", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.sfconcVar = self.createVariable("sfconc", ("time", "latitude", "longitude"))
         self.sfconcVar.description = "concentration of suspended matter at the surface"
         self.sfconcVar.units = "1"
         self.sfconcVar.long_name = "surface_concentration"
 
-        self.sfconc10mVar = self.ncdstfile.createVariable("sfconc10m", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.sfconc10mVar = self.createVariable("sfconc10m", ("time", "latitude", "longitude"))
         self.sfconc10mVar.description = "concentration of suspended matter at the surface at 10 meters"
         self.sfconc10mVar.units = "1"
         self.sfconc10mVar.long_name = "surface_concentration_10m"
 
-        self.sfconc30mVar = self.ncdstfile.createVariable("sfconc30m", "f4", ("time", "latitude", "longitude"), fill_value=1.e+37, zlib=True, complevel=4)
+        self.sfconc30mVar = self.createVariable("sfconc30m", ("time", "latitude", "longitude"))
         self.sfconc30mVar.description = "concentration of suspended matter at the surface at 30 meters"
         self.sfconc30mVar.units = "1"
         self.sfconc30mVar.long_name = "surface_concentration_30m"
 
-    def write(self):
         self.timeVar[:] = self.time
         self.lonVar[:] = self.lons
         self.latVar[:] = self.lats
         self.depthVar[:] = self.depths
-
-        self.concVar[:] = self.conc
-        self.sfconcVar[:] = self.sfconc
-        self.sfconc10mVar[:] = self.sfconc_10m
-        self.sfconc30mVar[:] = self.sfconc_30m
-        self.maskVar[:] = self.mask
-
-    def close(self):
-        if self.ncdstfile:
-            self.ncdstfile.close()